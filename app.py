@@ -1,348 +1,283 @@
-import geopandas as gpd
-import pandas as pd
-import folium
-from PyPDF2 import PdfReader
 import re
 from datetime import datetime, timedelta
+from urllib.parse import urlsplit
 import os
-from flask import Flask, render_template, request, jsonify, send_from_directory
-from io import StringIO # Per leggere tabelle da stringa
+import hashlib
+import gzip
+import functools
+import mimetypes
+import json
+import shutil
+import importlib.util
+import ipaddress
+import threading
+import uuid
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import events
+import metrics
+from bounded_cache import BoundedCache
+from flask import Flask, abort, render_template, request, jsonify, send_file, url_for
+from werkzeug.utils import safe_join
+
+# Le librerie pesanti (geopandas, pandas, numpy, shapely, folium, PyPDF2) vengono
+# importate nelle funzioni che le usano: il server web, la CLI e i worker le
+# caricano solo se ne hanno bisogno (o subito, con prewarm()).
 
 app = Flask(__name__)
 
+# --- Metriche (esposte su /metrics) ---
+
+STAGE_SECONDS = metrics.Histogram(
+    'bollettino_stage_duration_seconds', "Durata delle fasi di elaborazione del bollettino.", labels=('stage',))
+PIPELINE_RUNS = metrics.Counter(
+    'bollettino_pipeline_runs_total', "Elaborazioni del bollettino per esito.", labels=('result',))
+PDF_PAGES_READ = metrics.Counter(
+    'bollettino_pdf_pages_read_total', "Pagine del PDF di cui è stato estratto il testo.")
+CACHE_REQUESTS = metrics.Counter(
+    'bollettino_cache_requests_total', "Accessi alle cache per esito (hit/miss).", labels=('cache', 'result'))
+REGION_CACHE_EVICTIONS = metrics.Counter(
+    'bollettino_region_cache_evictions_total', "Voci rimosse dalla cache delle regioni per limite di memoria.",
+    labels=('kind',))
+MAPS_RENDERED = metrics.Counter(
+    'bollettino_maps_rendered_total', "Mappe HTML generate.", labels=('mode',))
+MAPS_REUSED = metrics.Counter(
+    'bollettino_maps_reused_total', "Mappe invariate riprese dalla generazione precedente.")
+OUTPUT_BYTES = metrics.Histogram(
+    'bollettino_output_bytes', "Dimensione dei file generati.", labels=('kind',),
+    buckets=(1e3, 1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6, 1e7, 5e7))
+
 # --- Funzioni di Elaborazione ---
 
-def extract_data_from_pdf(pdf_path):
+# Intestazione delle tabelle giornaliere, es. "PER LA GIORNATA DI OGGI, MERCOLEDI' 28/05/2025:"
+_DAY_HEADER_RE = re.compile(r"PER\s+LA\s+GIORNATA\s+DI\s+(OGGI|DOMANI)\b[^\n\d]*(\d{1,2}/\d{1,2}/\d{4})?", re.IGNORECASE)
+# Riga di una base di allerta, es. "BASI A1 ASSENTE-VERDE ORDINARIA - GIALLO ASSENTE-VERDE"
+_BASE_ROW_RE = re.compile(r"\bBASI\s+([A-Z]\d?)\b")
+# Livello di criticità, es. "ASSENTE-VERDE", "ORDINARIA - GIALLO" o solo "GIALLO"
+_LEVEL_RE = re.compile(r"(?:\b(?:ASSENTE|ORDINARIA|MODERATA|ELEVATA)\s*-\s*)?\b(VERDE|GIALLO|ARANCIONE|ROSSO)\b", re.IGNORECASE)
+# Riga della tabella Comune-Basi, es. "Ferrandina MT B-E2"
+_COMUNE_ROW_RE = re.compile(r"^\s*([^\d\s].*?)\s+([A-Z]{2})\s+([A-Z]\d?(?:\s*-\s*[A-Z]\d?)*)\s*$")
+
+LEVELS_PER_BASE = 3  # Idrogeologica, idrogeologica per temporali, idraulica
+# Righe consecutive non tabellari dopo le quali la tabella Comune-Basi si considera
+# conclusa (tollera intestazioni e piè di pagina a cavallo di un cambio pagina)
+COMUNI_TABLE_END_LINES = 5
+
+def _iter_pdf_lines(reader, read_seconds=None):
     """
-    Estrae le tabelle di criticità per oggi e domani e la mappatura Comune-Basi dal PDF.
+    Restituisce le righe di testo del PDF una pagina alla volta: il testo di una
+    pagina viene estratto solo quando il chiamante arriva a consumarla. Il tempo
+    di estrazione di ogni pagina viene aggiunto alla lista `read_seconds`, se indicata.
     """
-    bases_criticity_today = {}
-    bases_criticity_tomorrow = {}
+    for page in reader.pages:
+        start = time.perf_counter()
+        text = page.extract_text() or ""
+        if read_seconds is not None:
+            read_seconds.append(time.perf_counter() - start)
+        PDF_PAGES_READ.inc()
+        yield from text.splitlines()
+
+def parse_bulletin_lines(lines):
+    """
+    Analizza le righe di testo di un bollettino e ne estrae le tabelle di
+    criticità di oggi e domani (con le rispettive date) e la mappatura Comune-Basi.
+    Smette di consumare `lines` non appena tutte e tre le sezioni sono complete.
+    """
+    levels = {"OGGI": {}, "DOMANI": {}}
+    dates = {"OGGI": None, "DOMANI": None}
     comune_to_bases_mapping = {}
+    section = None
+    current_base = None
+    lines_since_comune_row = 0
 
-    try:
-        reader = PdfReader(pdf_path)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text()
-
-        # --- Estrazione criticità per OGGI ---
-        today_table_match = re.search(r"PER LA GIORNATA DI OGGI, MERCOLEDI'\s*28/05/2025:\s*(.*?)(?=PER LA GIORNATA DI DOMANI)", text, re.DOTALL)
-        if today_table_match:
-            today_table_str = today_table_match.group(1).strip()
-            # Pulizia e formattazione per facilitare la lettura della tabella
-            # Rimuovi le linee vuote o con solo spazi
-            today_table_lines = [line.strip() for line in today_table_str.split('\n') if line.strip()]
-            # Unisci le righe per ricreare la tabella, usando un separatore che non sia un ":"
-            # Adattamento per leggere la tabella che ho visto nello snippet:
-            # "BASI A1", "ASSENTE-VERDE", ...
-            # Sostituisco le virgole per i delimitatori, e gestisco le virgolette se ci sono (non ci sono nella fonte PDF)
-            
-            # Per l'OCR, la tabella viene presentata come CSV. Possiamo sfruttare questo.
-            # L'output dell'OCR non include "headers" e "data" in modo pulito.
-            # Dalle tabelle nello snippet, gli header sono:
-            # "ZONE DI ALLERTA","CRITICITA' IDROGEOLOGICA- COLORE ALLERTA","CRITICITA' IDROGEOLOGICA PER TEMPORALI-COLORE ALLERTA","CRITICITA' IDRAULICA - COLORE ALLERTA","NOTE"
-            
-            # Poiché l'OCR ha già formattato bene le tabelle in un formato CSV-like, posso leggere direttamente.
-            # Cerchiamo le tabelle specifiche per oggi e domani tramite il loro contenuto
-            
-            # --- Ricerca e Parsing delle tabelle di Criticità per OGGI e DOMANI ---
-            # Questo è più robusto se l'OCR fornisce direttamente il contenuto tabellare
-            
-            # Table 12: Criticità Oggi
-            if hasattr(reader.pages[0], 'extract_tables'): # Se PyPDF2 è in una versione che supporta tables (spesso no per testo semplice)
-                # Tentativo di estrazione tabelle (non sempre funziona bene con PDF scannerizzati o con testo embedded difficile)
-                # Questo è un placeholder per un parser di tabelle robusto.
-                pass # Non useremo questo per ora, ma lo lasciamo come nota.
-
-            # Alternative: estrai manualmente dal testo.
-            # Basandoci sull'OCR che ho ricevuto, le tabelle sono pulite.
-            # Trovo i dati del bollettino tramite le fonti (12 e 14)
-            # Per OGGI (source 12):
-            today_data_raw = [
-                "BASI A1","ASSENTE-VERDE","ASSENTE-VERDE","ASSENTE-VERDE",
-                "BASI A2","ASSENTE-VERDE","ASSENTE-VERDE","ASSENTE-VERDE",
-                "BASI B","ASSENTE-VERDE","ASSENTE-VERDE","ASSENTE-VERDE",
-                "BASI C","ASSENTE-VERDE","ASSENTE-VERDE","ASSENTE-VERDE",
-                "BASI D","ASSENTE-VERDE","ASSENTE-VERDE","ASSENTE-VERDE",
-                "BASI E1","ASSENTE-VERDE","ASSENTE-VERDE","ASSENTE-VERDE",
-                "BASI E2","ASSENTE - VERDE","ASSENTE-VERDE","ASSENTE - VERDE",
-            ]
-            # Headers per queste tabelle:
-            headers = ["ZONE DI ALLERTA", "CRITICITA' IDROGEOLOGICA", "CRITICITA' IDROGEOLOGICA PER TEMPORALI", "CRITICITA' IDRAULICA", "NOTE"]
-
-            # Processa i dati per OGGI
-            for i in range(0, len(today_data_raw), 4): # 4 colonne di dati, l'ultima è "NOTE" ma spesso vuota
-                zone = today_data_raw[i].replace('BASI ', '')
-                # Assumiamo che il colore sia sempre dopo "ASSENTE-" o "ORDINARIA-"
-                hydro_geo = today_data_raw[i+1].split('-')[-1].strip()
-                hydro_geo_temp = today_data_raw[i+2].split('-')[-1].strip()
-                hydraulic = today_data_raw[i+3].split('-')[-1].strip()
-                
-                # Applica la regola della massima gravosità per la criticità complessiva della base
-                max_criticity_numeric = max(
-                    get_criticity_level_numeric(hydro_geo),
-                    get_criticity_level_numeric(hydro_geo_temp),
-                    get_criticity_level_numeric(hydraulic)
-                )
-                
-                # Trova il colore corrispondente al livello numerico più alto
-                criticity_color = "VERDE" # Default
-                for color, level in {"ROSSO":4, "ARANCIONE":3, "GIALLO":2, "VERDE":1}.items():
-                    if level == max_criticity_numeric:
-                        criticity_color = color
-                        break
-                
-                bases_criticity_today[zone] = criticity_color # Salva la criticità massima per la base
-
-            # Per DOMANI (source 14):
-            tomorrow_data_raw = [
-                "BASI A1","ASSENTE - VERDE","ASSENTE-VERDE","ASSENTE-VERDE",
-                "BASI A2","ASSENTE-VERDE","ASSENTE - VERDE","ASSENTE-VERDE",
-                "BASI B","ASSENTE-VERDE","ORDINARIA-GIALLO","ASSENTE-VERDE",
-                "BASI C","ASSENTE-VERDE","ASSENTE-VERDE","ASSENTE-VERDE",
-                "BASI D","ASSENTE-VERDE","ASSENTE-VERDE","ASSENTE-VERDE",
-                "BASI E1","ASSENTE-VERDE","ORDINARIA - GIALLO","ASSENTE-VERDE",
-                "BASI E2","ASSENTE-VERDE","ORDINARIA - GIALLO","ASSENTE-VERDE",
-            ]
-
-            # Processa i dati per DOMANI
-            for i in range(0, len(tomorrow_data_raw), 4):
-                zone = tomorrow_data_raw[i].replace('BASI ', '')
-                hydro_geo = tomorrow_data_raw[i+1].split('-')[-1].strip()
-                hydro_geo_temp = tomorrow_data_raw[i+2].split('-')[-1].strip()
-                hydraulic = tomorrow_data_raw[i+3].split('-')[-1].strip()
-                
-                max_criticity_numeric = max(
-                    get_criticity_level_numeric(hydro_geo),
-                    get_criticity_level_numeric(hydro_geo_temp),
-                    get_criticity_level_numeric(hydraulic)
-                )
-                
-                criticity_color = "VERDE"
-                for color, level in {"ROSSO":4, "ARANCIONE":3, "GIALLO":2, "VERDE":1}.items():
-                    if level == max_criticity_numeric:
-                        criticity_color = color
-                        break
-                
-                bases_criticity_tomorrow[zone] = criticity_color
-
-        # --- Estrazione mappatura Comune-Basi (Pagina 2 del PDF) ---
-        # La tabella parte da "Abriola" e finisce con "Viggiano" o "Viggianello"
-        # Source 19 e 20 sono le tabelle.
-        # Useremo il testo direttamente come fornito dall'OCR, che è quasi CSV.
-        
-        # Unione dei dati dalla fonte 19 e 20:
-        comuni_bases_list = [
-            ["Abriola","PZ","B"],
-            ["Accettura","MT","B"],
-            ["Acerenza","PZ","B"],
-            ["Albano di Lucania","PZ","B"],
-            ["Aliano","MT","C"],
-            ["Anzi","PZ","B"],
-            ["Armento","PZ","C"],
-            ["Atella","PZ","A1"],
-            ["Avigliano","PZ","B"],
-            ["Balvano","PZ","A2"],
-            ["Banzi","PZ","B"],
-            ["Baragiano","PZ","A2"],
-            ["Barile","PZ","A1"],
-            ["Bella","PZ","A2"],
-            ["Bernalda","MT","E2"],
-            ["Brienza","PZ","A2"],
-            ["Brindisi Montagna","PZ","B"],
-            ["Calciano","MT","B"],
-            ["Calvello","PZ","B"],
-            ["Calvera","PZ","C"],
-            ["Campomaggiore","PZ","B"],
-            ["Cancellara","PZ","B"],
-            ["Carbone","PZ","C"],
-            ["Castelgrande","PZ","A2"],
-            ["Castelluccio Inferiore","PZ","D"],
-            ["Castelluccio Superiore","PZ","D"],
-            ["Castelmezzano","PZ","B"],
-            ["Castelsaraceno","PZ","D"],
-            ["Castronuovo di Sant' Andrea","PZ","C"],
-            ["Cersosimo","PZ","C"],
-            ["Chiaromonte","PZ","C"],
-            ["Cirigliano","MT","C"],
-            ["Colobraro","MT","C"],
-            ["Corleto Perticara","PZ","C"],
-            ["Craco","MT","E1"],
-            ["Episcopia","PZ","C"],
-            ["Fardella","PZ","C"],
-            ["Ferrandina","MT","B-E2"],
-            ["Filiano","PZ","A1-B"],
-            ["Forenza","PZ","A1-B"],
-            ["Francavilla in Sinni","PZ","C"],
-            ["Gallicchio","PZ","C"],
-            ["Garaguso","MT","B"],
-            ["Genzano di Lucania","PZ","B"],
-            ["Ginestra","PZ","A1"],
-            ["Gorgoglione","MT","C"],
-            ["Grassano","MT","B"],
-            ["Grottole","MT","B"],
-            ["Grumento Nova","PZ","C"],
-            ["Guardia Perticara","PZ","C"],
-            ["Irsina","MT","B"],
-            ["Lagonegro","PZ","D"],
-            ["Latronico","PZ","D"],
-            ["Laurenzana","PZ","B"],
-            ["Lauria","PZ","D"],
-            ["Lavello","PZ","A1"],
-            ["Maratea","PZ","D"],
-            ["Marsico Nuovo","PZ","C"],
-            ["Marsicovetere","PZ","C"],
-            ["Maschito","PZ","A1"],
-            ["Matera","MT","B"],
-            ["Melfi","PZ","A1"],
-            ["Miglionico","MT","B"],
-            ["Missanello","PZ","C"],
-            ["Moliterno","PZ","C"],
-            ["Montalbano Jonico","MT","E1"],
-            ["Montemilone","PZ","A1"],
-            ["Montemurro","PZ","C"],
-            ["Montescaglioso","MT","E2"],
-            ["Muro Lucano","PZ","A2"],
-            ["Nemoli","PZ","D"],
-            ["Noepoli","PZ","C"],
-            ["Nova Siri","MT","E1"],
-            ["Oliveto Lucano","MT","B"],
-            ["Oppido Lucano","PZ","B"],
-            ["Palazzo San Gervasio","PZ","A1"],
-            ["Paterno","PZ","C"],
-            ["Pescopagano","PZ","A1"],
-            ["Picerno","PZ","A2"],
-            ["Pietragalla","PZ","B"],
-            ["Pietrapertosa","PZ","B"],
-            ["Pignola","PZ","B"],
-            ["Pisticci","MT","E2"],
-            ["Policoro","MT","E1"],
-            ["Pomarico","MT","B-E2"],
-            ["Potenza","PZ","B"],
-            ["Rapolla","PZ","A1"],
-            ["Rapone","PZ","A1"],
-            ["Rionero in Vulture","PZ","A1"],
-            ["Ripacandida","PZ","A1"],
-            ["Rivello","PZ","D"],
-            ["Roccanova","PZ","C"],
-            ["Rotonda","PZ","D"],
-            ["Rotondella","MT","E1"],
-            ["Ruoti","PZ","A2"],
-            ["Ruvo del Monte","PZ","A1"],
-            ["Salandra","MT","B"],
-            ["San Chirico Nuovo","PZ","B"],
-            ["San Chirico Raparo","PZ","C"],
-            ["San Costantino A.","PZ","C"],
-            ["San Fele","PZ","A1"],
-            ["San Giorgio Lucano","MT","C"],
-            ["San Martino d'Agri","PZ","C"],
-            ["San Mauro Forte","MT","B"],
-            ["San Paolo Albanese","PZ","C"],
-            ["San Severino Lucano","PZ","C"],
-            ["Sant' Angelo Le Fratte","PZ","A2"],
-            ["Sant' Arcangelo","PZ","C"],
-            ["Sarconi","PZ","C"],
-            ["Sasso di Castalda","PZ","A2"],
-            ["Satriano di Lucania","PZ","A2"],
-            ["Savoia di Lucania","PZ","A2"],
-            ["Scanzano Jonico","MT","E1"],
-            ["Senise","PZ","C"],
-            ["Spinoso","PZ","C"],
-            ["Stigliano","MT","C"],
-            ["Teana","PZ","C"],
-            ["Terranova di Pollino","PZ","C"],
-            ["Tito","PZ","A2-B"],
-            ["Tolve","PZ","B"],
-            ["Tramutola","PZ","C"],
-            ["Trecchina","PZ","D"],
-            ["Tricarico","MT","B"],
-            ["Trivigno","PZ","B"],
-            ["Tursi","MT","C-E1"],
-            ["Vaglio Basilicata","PZ","B"],
-            ["Valsinni","MT","C"],
-            ["Venosa","PZ","A1"],
-            ["Vietri di Potenza","PZ","A2"],
-            ["Viggianello","PZ","D"],
-            ["Viggiano","PZ","C"]
-        ]
-        
-        for row in comuni_bases_list:
-            comune = row[0]
-            bases_str = row[2]
+    def day_tables_complete():
+        today, tomorrow = levels["OGGI"], levels["DOMANI"]
+        # Le due tabelle elencano le stesse basi: domani è completa quando le contiene tutte
+        return (today and set(today) <= set(tomorrow)
+                and all(len(found) >= LEVELS_PER_BASE for found in tomorrow.values()))
+
+    for line in lines:
+        header = _DAY_HEADER_RE.search(line)
+        if header:
+            section = header.group(1).upper()
+            dates[section] = header.group(2)
+            current_base = None
+            continue
+
+        base_row = _BASE_ROW_RE.search(line)
+        comune_row = None if base_row else _COMUNE_ROW_RE.match(line)
+        if comune_row:
+            section = "COMUNI"
+            comune, _, bases_str = comune_row.groups()
             # Gestisce casi come "B-E2" o "A1-B"
-            bases_list = [b.strip() for b in bases_str.split('-') if b.strip()]
-            comune_to_bases_mapping[comune] = bases_list
+            comune_to_bases_mapping[comune.strip()] = [b.strip() for b in bases_str.split('-') if b.strip()]
+            lines_since_comune_row = 0
+            continue
+
+        if section in levels:
+            if base_row:
+                current_base = base_row.group(1)
+                levels[section][current_base] = []
+                line = line[base_row.end():]
+            if current_base is not None:
+                found = levels[section][current_base]
+                found.extend(m.group(1).upper() for m in _LEVEL_RE.finditer(line))
+                del found[LEVELS_PER_BASE:]
+        elif section == "COMUNI" and line.strip():
+            lines_since_comune_row += 1
+
+        if (lines_since_comune_row >= COMUNI_TABLE_END_LINES
+                and day_tables_complete()):
+            break
+
+    bases_criticity = {}
+    for day, day_levels in levels.items():
+        # Regola della massima gravosità tra i tre tipi di criticità della base
+        bases_criticity[day] = {
+            base: CRITICITY_COLORS_BY_LEVEL[max(get_criticity_level_numeric(color) for color in found)]
+            for base, found in day_levels.items() if found
+        }
+
+    return {
+        "today": bases_criticity["OGGI"],
+        "tomorrow": bases_criticity["DOMANI"],
+        "today_date": dates["OGGI"],
+        "tomorrow_date": dates["DOMANI"],
+        "comune_to_bases_mapping": comune_to_bases_mapping,
+    }
+
+def extract_bulletin(pdf_path):
+    """
+    Estrae dal PDF le criticità per oggi e domani, le relative date (gg/mm/aaaa,
+    None se non trovate) e la mappatura Comune-Basi, leggendo solo le pagine necessarie.
+    """
+    from PyPDF2 import PdfReader
 
+    start = time.perf_counter()
+    reader = PdfReader(pdf_path)
+    read_seconds = [time.perf_counter() - start]
+    bulletin = parse_bulletin_lines(_iter_pdf_lines(reader, read_seconds))
+    # Lettura e analisi sono intercalate (pagina per pagina): le due durate si
+    # ottengono separando il tempo di estrazione del testo dal totale
+    pdf_read = sum(read_seconds)
+    STAGE_SECONDS.observe(pdf_read, stage="pdf_read")
+    STAGE_SECONDS.observe(time.perf_counter() - start - pdf_read, stage="table_parse")
+    return bulletin
+
+def extract_data_from_pdf(pdf_path):
+    """
+    Estrae le tabelle di criticità per oggi e domani e la mappatura Comune-Basi dal PDF.
+    """
+    try:
+        bulletin = extract_bulletin(pdf_path)
     except Exception as e:
         print(f"Errore durante l'estrazione dati dal PDF: {e}")
         return {}, {}, {} # Restituisce dizionari vuoti in caso di errore
-    
-    return bases_criticity_today, bases_criticity_tomorrow, comune_to_bases_mapping
+
+    return bulletin["today"], bulletin["tomorrow"], bulletin["comune_to_bases_mapping"]
+
+CRITICITY_LEVELS = {
+    "ROSSO": 4,
+    "ARANCIONE": 3,
+    "GIALLO": 2,
+    "VERDE": 1,
+    "ASSENTE": 1 # Trattiamo "Assente" come "VERDE"
+}
+# Colore canonico per ogni livello numerico (inverso di CRITICITY_LEVELS)
+CRITICITY_COLORS_BY_LEVEL = {4: "ROSSO", 3: "ARANCIONE", 2: "GIALLO", 1: "VERDE"}
 
 def get_criticity_level_numeric(color):
     """
     Restituisce un valore numerico per il livello di criticità.
     Più alto il numero, più alta la criticità.
     """
-    criticity_map = {
-        "ROSSO": 4,
-        "ARANCIONE": 3,
-        "GIALLO": 2,
-        "VERDE": 1,
-        "ASSENTE": 1 # Trattiamo "Assente" come "VERDE"
-    }
-    return criticity_map.get(color.upper(), 0)
+    return CRITICITY_LEVELS.get(color.upper(), 0)
 
-def assign_municipalities_criticity(gdf_municipalities, bases_criticity_data, comune_to_bases_mapping):
+def compute_municipalities_criticity(comune_names, bases_criticity_by_day, comune_to_bases_mapping):
     """
-    Assegna il livello di criticità a ciascun comune basandosi sulle basi di allerta
-    e sulla regola della massima gravosità.
+    Calcola in forma colonnare il livello numerico di criticità dei comuni per
+    uno o più giorni, con la regola della massima gravosità tra le basi del comune.
+
+    `bases_criticity_by_day` è un dizionario {giorno: {base: colore}}; il risultato
+    è un DataFrame con una riga per ciascun elemento di `comune_names` (stesso ordine)
+    e una colonna di interi per ciascun giorno. I comuni senza basi, o con basi non
+    presenti nel bollettino, restano VERDE.
     """
-    
-    # Inizializza le colonne di criticità
-    gdf_municipalities['criticity_level_color'] = "VERDE"
-    gdf_municipalities['criticity_level_numeric'] = get_criticity_level_numeric("VERDE")
+    import pandas as pd
 
-    for index, row in gdf_municipalities.iterrows():
-        comune_name = row['name']
-        
-        # Ottieni le basi a cui appartiene questo comune dalla mappatura estratta dal PDF
-        applicable_bases = comune_to_bases_mapping.get(comune_name, [])
+    days = list(bases_criticity_by_day)
+    verde = CRITICITY_LEVELS["VERDE"]
 
-        max_criticity_numeric = get_criticity_level_numeric("VERDE") # Inizia con Verde
-        final_criticity_color = "VERDE"
+    # Tabella (comune, base): una riga per ogni base del comune
+    comune_bases = pd.Series(comune_to_bases_mapping, dtype=object).explode().dropna()
+    comune_bases = pd.DataFrame({'name': comune_bases.index, 'base': comune_bases.to_numpy()})
 
-        for base_key in applicable_bases: # 'A1', 'B', 'E2'
-            # Recupera il colore della base dal bollettino per il giorno specifico
-            base_color = bases_criticity_data.get(base_key, "VERDE") 
-            current_criticity_numeric = get_criticity_level_numeric(base_color)
+    # Tabella (base, giorno) -> livello numerico
+    base_levels = pd.DataFrame(bases_criticity_by_day, columns=days, dtype=object)
+    base_levels = base_levels.apply(lambda colors: colors.str.upper().map(CRITICITY_LEVELS))
+    base_levels.index.name = 'base'
 
-            if current_criticity_numeric > max_criticity_numeric:
-                max_criticity_numeric = current_criticity_numeric
-                final_criticity_color = base_color
-        
-        # Se il comune non è mappato a nessuna base, rimane VERDE
-        gdf_municipalities.at[index, 'criticity_level_color'] = final_criticity_color
-        gdf_municipalities.at[index, 'criticity_level_numeric'] = max_criticity_numeric
+    comune_levels = (
+        comune_bases.merge(base_levels, left_on='base', right_index=True, how='left')
+        .groupby('name')[days].max()
+    )
+    return (
+        comune_levels.reindex(pd.Index(comune_names))
+        .fillna(verde)
+        .clip(lower=verde)
+        .astype(int)
+        .reset_index(drop=True)
+    )
+
+def assign_municipalities_criticity(gdf_municipalities, bases_criticity_data, comune_to_bases_mapping):
+    """
+    Assegna il livello di criticità a ciascun comune basandosi sulle basi di allerta
+    e sulla regola della massima gravosità.
+    """
+    levels = compute_municipalities_criticity(
+        gdf_municipalities['name'], {"giorno": bases_criticity_data}, comune_to_bases_mapping
+    )["giorno"]
+    return set_criticity_columns(gdf_municipalities, levels)
 
+def set_criticity_columns(gdf_municipalities, levels):
+    """
+    Imposta le colonne criticity_level_numeric e criticity_level_color dai
+    livelli numerici `levels` (uno per comune, nello stesso ordine).
+    """
+    gdf_municipalities['criticity_level_numeric'] = levels.to_numpy()
+    gdf_municipalities['criticity_level_color'] = levels.map(CRITICITY_COLORS_BY_LEVEL).to_numpy()
     return gdf_municipalities
 
-def create_styled_map(gdf, title_suffix, output_dir, file_prefix, center_coords=[40.5, 16.0], zoom_start=8):
+CRITICITY_FILL_COLORS = {
+    "ROSSO": "#C30000",      # Rosso scuro
+    "ARANCIONE": "#FF8C00",  # Arancione
+    "GIALLO": "#FFD700",     # Giallo oro
+    "VERDE": "#008000",      # Verde scuro
+    "NON MAPPATA": "lightgray",
+    "ASSENTE": "#008000"     # Trattiamo "Assente" come verde
+}
+
+def create_styled_map(gdf, title_suffix, output_dir, file_prefix, center_coords=[40.5, 16.0], zoom_start=8, geometry_version=None):
     """
     Crea mappe Folium con i comuni colorati in base alla criticità.
+    Se è indicata la versione della geometria, i poligoni incorporati sono quelli
+    semplificati per il livello di zoom iniziale.
     """
-    
-    color_map = {
-        "ROSSO": "#C30000",      # Rosso scuro
-        "ARANCIONE": "#FF8C00",  # Arancione
-        "GIALLO": "#FFD700",     # Giallo oro
-        "VERDE": "#008000",      # Verde scuro
-        "NON MAPPATA": "lightgray",
-        "ASSENTE": "#008000"     # Trattiamo "Assente" come verde
-    }
-    
     generated_map_files = []
+    for render, args in styled_map_tasks(gdf, title_suffix, output_dir, file_prefix, center_coords, zoom_start, geometry_version):
+        generated_map_files.extend(render(*args))
+    return generated_map_files
+
+def styled_map_tasks(gdf, title_suffix, output_dir, file_prefix, center_coords=[40.5, 16.0], zoom_start=8, geometry_version=None):
+    """
+    Prepara le mappe di create_styled_map come task indipendenti (funzione, argomenti),
+    uno per livello di rischio, eseguibili anche in un altro processo.
+    """
+    if geometry_version is not None:
+        gdf = municipalities_for_zoom(gdf, geometry_version, zoom_start)
 
     # Ordina i livelli di rischio per garantire che le mappe più critiche siano elencate per prime
     # (o per una visualizzazione logica se ci fossero più mappe)
@@ -356,6 +291,7 @@ def create_styled_map(gdf, title_suffix, output_dir, file_prefix, center_coords=
     # Oppure mantieni l'approccio "una mappa per ogni rischio" se preferisci.
     # Per la "griglia" e la visualizzazione più pulita, una mappa per rischio è meglio.
 
+    tasks = []
     for risk_color in ordered_risk_levels:
         
         gdf_filtered = gdf[gdf['criticity_level_color'] == risk_color]
@@ -363,116 +299,1758 @@ def create_styled_map(gdf, title_suffix, output_dir, file_prefix, center_coords=
         if gdf_filtered.empty:
             continue
 
-        # Crea una nuova mappa Folium per ogni livello di rischio
-        m = folium.Map(location=center_coords, zoom_start=zoom_start, control_scale=True)
-
-        folium.GeoJson(
-            gdf_filtered,
-            name=f'Comuni - Rischio {risk_color}',
-            style_function=lambda feature: {
-                'fillColor': color_map.get(feature['properties']['criticity_level_color'], 'lightgray'),
-                'color': 'black',
-                'weight': 0.5,
-                'fillOpacity': 0.7
-            },
-            tooltip=folium.features.GeoJsonTooltip(fields=['name', 'criticity_level_color'],
-                                                   aliases=['Comune:', 'Criticità:'],
-                                                   localize=True)
-        ).add_to(m)
-
-        # Aggiungi un TileLayer per il contesto
-        folium.TileLayer('OpenStreetMap').add_to(m)
-        folium.LayerControl().add_to(m)
-
-        map_filename = f"{file_prefix}_{risk_color.lower()}.html"
-        full_path = os.path.join(output_dir, map_filename)
-        m.save(full_path)
-        generated_map_files.append({"filename": map_filename, "title": f"Mappa {title_suffix} - Rischio {risk_color}"})
-        print(f"Mappa per {title_suffix} (Rischio '{risk_color}') salvata in: {full_path}")
-    
-    return generated_map_files
+        tasks.append((_render_risk_level_map,
+                      (gdf_filtered, risk_color, title_suffix, output_dir, file_prefix, center_coords, zoom_start)))
+    return tasks
+
+# --- Varianti precompresse dei file serviti ---
+
+# Codifiche scritte accanto a ogni file ("mappa.html.gz", "mappa.html.br"), in ordine
+# di preferenza a parità di qualità nell'Accept-Encoding del client
+PRECOMPRESSED_ENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+PRECOMPRESS_MIN_BYTES = 1024  # Sotto questa dimensione la compressione non conviene
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 9  # 11 comprime poco di più ma è molto più lento sulle mappe grandi
+
+def _brotli():
+    # Dipendenza facoltativa: senza il modulo brotli vengono scritte solo le varianti gzip
+    if importlib.util.find_spec('brotli') is None:
+        return None
+    import brotli
+    return brotli
+
+def write_precompressed(path, data, kind):
+    """
+    Scrive accanto a `path` le varianti compresse di `data` (il contenuto di `path`),
+    tralasciando quelle che non risultano più piccole dell'originale.
+    """
+    if len(data) < PRECOMPRESS_MIN_BYTES:
+        return
+    variants = {".gz": lambda: gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)}
+    brotli = _brotli()
+    if brotli is not None:
+        variants[".br"] = lambda: brotli.compress(data, quality=BROTLI_QUALITY)
+    for suffix, compress in variants.items():
+        with STAGE_SECONDS.time(stage="precompress"):
+            compressed = compress()
+        if len(compressed) >= len(data):
+            continue
+        tmp_path = f"{path}{suffix}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(compressed)
+        os.replace(tmp_path, path + suffix)
+        OUTPUT_BYTES.observe(len(compressed), kind=kind + suffix)
+
+def precompressed_variants(path):
+    """
+    Il file e le sue varianti compresse presenti su disco.
+    """
+    return [path] + [path + suffix for _, suffix in PRECOMPRESSED_ENCODINGS if os.path.exists(path + suffix)]
+
+def _write_map_html(m, full_path, mode):
+    """
+    Genera l'HTML della mappa e lo scrive su disco (come folium.Map.save), con
+    le varianti precompresse, misurando separatamente rendering e scrittura.
+    """
+    with STAGE_SECONDS.time(stage="map_render"):
+        data = m.get_root().render().encode('utf8')
+    with STAGE_SECONDS.time(stage="map_write"):
+        with open(full_path, 'wb') as f:
+            f.write(data)
+    write_precompressed(full_path, data, kind="map_html")
+    MAPS_RENDERED.inc(mode=mode)
+    OUTPUT_BYTES.observe(len(data), kind="map_html")
+
+def _render_risk_level_map(gdf_filtered, risk_color, title_suffix, output_dir, file_prefix, center_coords, zoom_start):
+    import folium
+
+    color_map = CRITICITY_FILL_COLORS
+
+    # Crea una nuova mappa Folium per ogni livello di rischio
+    build_start = time.perf_counter()
+    m = folium.Map(location=center_coords, zoom_start=zoom_start, control_scale=True)
+
+    folium.GeoJson(
+        gdf_filtered,
+        name=f'Comuni - Rischio {risk_color}',
+        style_function=lambda feature: {
+            'fillColor': color_map.get(feature['properties']['criticity_level_color'], 'lightgray'),
+            'color': 'black',
+            'weight': 0.5,
+            'fillOpacity': 0.7
+        },
+        tooltip=folium.features.GeoJsonTooltip(fields=['name', 'criticity_level_color'],
+                                               aliases=['Comune:', 'Criticità:'],
+                                               localize=True)
+    ).add_to(m)
+
+    # Aggiungi un TileLayer per il contesto
+    folium.TileLayer('OpenStreetMap').add_to(m)
+    folium.LayerControl().add_to(m)
+
+    STAGE_SECONDS.observe(time.perf_counter() - build_start, stage="map_build")
+
+    map_filename = f"{file_prefix}_{risk_color.lower()}.html"
+    full_path = os.path.join(output_dir, map_filename)
+    _write_map_html(m, full_path, mode="embedded")
+    print(f"Mappa per {title_suffix} (Rischio '{risk_color}') salvata in: {full_path}")
+    return [{"filename": map_filename, "title": f"Mappa {title_suffix} - Rischio {risk_color}"}]
+
+# --- Geometria multi-risoluzione ---
+
+# Livelli di dettaglio della geometria: (zoom massimo, tolleranza di semplificazione
+# in gradi); l'ultimo livello, senza zoom massimo, è la geometria a piena risoluzione
+GEOMETRY_LEVELS = [(8, 0.002), (10, 0.0005), (12, 0.0001), (None, 0)]
+
+def _build_simplified_levels(gdf):
+    import topology
+
+    simplify_start = time.perf_counter()
+    base_topology = topology.build_topology(gdf.geometry)
+    levels = []
+    for max_zoom, tolerance in GEOMETRY_LEVELS:
+        levels.append((max_zoom, topology.simplify_valid(base_topology, tolerance)))
+    STAGE_SECONDS.observe(time.perf_counter() - simplify_start, stage="geometry_simplify")
+    return levels
+
+def _simplified_levels(gdf, version):
+    """
+    Topologia dei comuni (archi condivisi, quantizzati) semplificata a ciascun
+    livello di GEOMETRY_LEVELS, calcolata una volta per versione della geometria
+    (e conservata nella cache delle regioni).
+    Se a un livello qualche poligono risulta non valido, la tolleranza viene dimezzata.
+    """
+    return _region_cache.get_or_create(
+        ("levels", version), lambda: _build_simplified_levels(gdf),
+        lambda levels: sum(_TOPOLOGY_POINT_BYTES * len(arc) for _, simplified in levels for arc in simplified["arcs"]))
+
+def municipalities_for_zoom(gdf, version, zoom):
+    """
+    Restituisce una copia di `gdf` con la geometria semplificata adatta al livello di zoom.
+    """
+    import geopandas as gpd
+    import topology
+
+    for max_zoom, simplified in _simplified_levels(gdf, version):
+        if max_zoom is None or zoom <= max_zoom:
+            break
+    gdf = gdf.copy()
+    gdf.geometry = gpd.GeoSeries(topology.topology_to_geometries(simplified), index=gdf.index, crs=gdf.crs)
+    return gdf
+
+TOPOLOGY_MODULE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'topology.py')
+
+def _geometry_assets_key(version):
+    # Il contenuto degli asset dipende, oltre che dalla geometria, dai livelli di
+    # semplificazione e dal codice della topologia (quantizzazione compresa)
+    stat = os.stat(TOPOLOGY_MODULE_PATH)
+    parts = [version, repr(GEOMETRY_LEVELS), _stat_file_sha256(TOPOLOGY_MODULE_PATH, stat.st_mtime_ns, stat.st_size)]
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()
+
+def _geometry_asset_filenames(version):
+    """
+    [(max_zoom, filename)] degli asset TopoJSON per la versione della geometria.
+    """
+    key = _geometry_assets_key(version)[:16]
+    return [(max_zoom, f"municipalities_{key}_{f'z{max_zoom}' if max_zoom is not None else 'full'}.topojson")
+            for max_zoom, _ in GEOMETRY_LEVELS]
+
+def write_geometry_assets(gdf, output_dir, version):
+    """
+    Scrive (una sola volta per versione della geometria) un TopoJSON quantizzato per
+    ogni livello di dettaglio e restituisce [{"max_zoom", "filename"}, ...]. I nomi file
+    contengono un hash della geometria, dei livelli e del codice della topologia,
+    quindi i file possono essere messi in cache per sempre. Se tutti gli asset
+    esistono già la topologia non viene ricalcolata.
+    """
+    import topology
+
+    os.makedirs(output_dir, exist_ok=True)
+    filenames = _geometry_asset_filenames(version)
+    if not all(os.path.exists(os.path.join(output_dir, filename)) for _, filename in filenames):
+        properties = [{"name": name} for name in gdf['name']]
+        for (max_zoom, simplified), (_, filename) in zip(_simplified_levels(gdf, version), filenames):
+            full_path = os.path.join(output_dir, filename)
+            if os.path.exists(full_path):
+                continue
+            tmp_path = f"{full_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with STAGE_SECONDS.time(stage="geometry_asset_write"):
+                data = json.dumps(topology.to_topojson(simplified, properties), separators=(',', ':')).encode('utf-8')
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, full_path)
+            write_precompressed(full_path, data, kind="geometry_topojson")
+            OUTPUT_BYTES.observe(len(data), kind="geometry_topojson")
+    for _, filename in filenames:
+        full_path = os.path.join(output_dir, filename)
+        if not os.path.exists(full_path + '.gz') and os.path.getsize(full_path) >= PRECOMPRESS_MIN_BYTES:
+            # Asset scritto prima delle varianti precompresse
+            with open(full_path, 'rb') as f:
+                write_precompressed(full_path, f.read(), kind="geometry_topojson")
+    return [{"max_zoom": max_zoom, "filename": filename} for max_zoom, filename in filenames]
+
+def _geometry_assets_written(version):
+    return all(os.path.exists(os.path.join(GEOMETRY_ASSETS_DIR, filename))
+               for _, filename in _geometry_asset_filenames(version))
+
+TOPOJSON_CLIENT_JS = 'https://cdn.jsdelivr.net/npm/topojson-client@3/dist/topojson-client.min.js'
+
+# Livelli di rischio come layer attivabili; la geometria viene scaricata dal browser
+# (asset statici con cache a lungo termine, al livello di dettaglio adatto allo zoom)
+# e colorata lato client con la tabella dei livelli, indicizzata per "id" della feature.
+_SHARED_GEOMETRY_LAYERS_SOURCE = """
+{% macro script(this, kwargs) %}
+    (function() {
+        var map = {{ this._parent.get_name() }};
+        var levels = {{ this.levels|tojson }};
+        var orderedLevels = {{ this.ordered_levels|tojson }};
+        var levelNames = {{ this.level_names|tojson }};
+        var fillColors = {{ this.fill_colors|tojson }};
+        var geometryLevels = {{ this.geometry_levels|tojson }};
+        var control = L.control.layers(null, null, {collapsed: false}).addTo(map);
+        var layers = {};
+        orderedLevels.forEach(function(level) {
+            var name = levelNames[level];
+            layers[level] = L.geoJSON(null, {
+                filter: function(feature) { return levels[feature.id] === level; },
+                style: {fillColor: fillColors[name], color: 'black', weight: 0.5, fillOpacity: 0.7},
+                onEachFeature: function(feature, featureLayer) {
+                    featureLayer.bindTooltip('Comune: ' + feature.properties.name + '<br>Criticità: ' + name);
+                }
+            }).addTo(map);
+            control.addOverlay(layers[level], 'Rischio ' + name);
+        });
+
+        var downloads = {};
+        var current = null;
+        function refresh() {
+            var zoom = map.getZoom();
+            var geometry = geometryLevels.find(function(g) { return g.max_zoom === null || zoom <= g.max_zoom; });
+            if (geometry === current) { return; }
+            current = geometry;
+            downloads[geometry.url] = downloads[geometry.url] || fetch(geometry.url)
+                .then(function(response) { return response.json(); })
+                .then(function(topo) { return topojson.feature(topo, topo.objects.municipalities); });
+            downloads[geometry.url].then(function(geojson) {
+                if (current !== geometry) { return; }
+                orderedLevels.forEach(function(level) {
+                    layers[level].clearLayers();
+                    layers[level].addData(geojson);
+                });
+            });
+        }
+        map.on('zoomend', refresh);
+        refresh();
+    })();
+{% endmacro %}
+"""
+
+@functools.cache
+def _shared_geometry_layers_template():
+    from folium.template import Template
+    return Template(_SHARED_GEOMETRY_LAYERS_SOURCE)
+
+def create_daily_map(gdf, title_suffix, output_dir, file_prefix, geometry_levels, center_coords=[40.5, 16.0], zoom_start=8):
+    """
+    Crea un'unica mappa Folium per il giorno, con un layer attivabile per ogni
+    livello di rischio. La mappa non contiene la geometria dei comuni ma solo il
+    livello di ciascun comune: i poligoni vengono letti dal TopoJSON di
+    `geometry_levels` ([{"max_zoom", "url"}], da write_geometry_assets per lo
+    stesso GeoDataFrame) adatto allo zoom corrente.
+    """
+    import folium
+    from branca.element import JavascriptLink, MacroElement
+
+    build_start = time.perf_counter()
+    levels = gdf['criticity_level_numeric'].astype(int).tolist()
+    ordered_levels = sorted(set(levels), reverse=True)
+
+    m = folium.Map(location=center_coords, zoom_start=zoom_start, control_scale=True)
+    m.get_root().header.add_child(JavascriptLink(TOPOJSON_CLIENT_JS))
+    layers = MacroElement()
+    layers._template = _shared_geometry_layers_template()
+    layers.levels = levels
+    layers.ordered_levels = ordered_levels
+    layers.level_names = CRITICITY_COLORS_BY_LEVEL
+    layers.fill_colors = CRITICITY_FILL_COLORS
+    layers.geometry_levels = geometry_levels
+    m.add_child(layers)
+    STAGE_SECONDS.observe(time.perf_counter() - build_start, stage="map_build")
+
+    map_filename = f"{file_prefix}.html"
+    full_path = os.path.join(output_dir, map_filename)
+    _write_map_html(m, full_path, mode="shared")
+    print(f"Mappa per {title_suffix} salvata in: {full_path}")
+    return [{"filename": map_filename, "title": f"Mappa {title_suffix}"}]
 
 # --- Configurazione Flask ---
 
+# Creata alla prima generazione pubblicata di ciascuna regione
 STATIC_MAPS_DIR = os.path.join(app.root_path, 'static', 'maps')
-os.makedirs(STATIC_MAPS_DIR, exist_ok=True)
+
+# Asset statici condivisi dalle mappe (geometria dei comuni), con cache a lungo termine
+GEOMETRY_ASSETS_DIR = os.path.join(app.root_path, 'static', 'geometry')
+GEOMETRY_ASSETS_MAX_AGE = 365 * 24 * 3600
+
+# "shared": una mappa per giorno con geometria condivisa (create_daily_map);
+# "embedded": una mappa per livello di rischio con la geometria incorporata (create_styled_map)
+MAP_RENDER_MODE = 'shared'
 
 GEOJSON_MUNICIPALITIES_PATH = 'limits_R_17_municipalities.geojson'
 # Questo è il file PDF che si assume presente nella stessa directory di app.py
 BOLLETTINO_PDF_PATH = 'Bollettino_Criticita_Regione_Basilicata_28_05_2025.pdf' # Il nome corretto del file
 
-@app.route('/')
-def index():
+# --- Regioni ---
+
+# Regioni servite, da un file JSON facoltativo:
+#   {"<id>": {"name": "...", "geojson": "...", "pdf": "...", "zone_mapping": "..."}}
+# dove "zone_mapping" (facoltativo) è un JSON {comune: [zone, ...]} usato per i
+# bollettini che non riportano la tabella dei comuni. Senza il file viene servita
+# solo la Basilicata, con i percorsi qui sopra. Le mappe di ogni regione sono in
+# STATIC_MAPS_DIR/<id>/; geometria e mappature vengono caricate al primo uso.
+REGIONS_CONFIG_PATH = 'regions.json'
+DEFAULT_REGION = 'basilicata'
+_REGION_ID_RE = re.compile(r"[a-z0-9_-]+")
+
+_regions_config = {"mtime_ns": None, "regions": None}
+_regions_config_lock = threading.Lock()
+
+def load_regions():
     """
-    Pagina principale del portale.
+    Restituisce le regioni configurate {id: {"name", "geojson", "pdf", "zone_mapping"}},
+    rileggendo REGIONS_CONFIG_PATH solo quando cambia.
     """
-    generated_maps = []
-    if os.path.exists(STATIC_MAPS_DIR):
-        # Ordina i file per un'esposizione più coerente
-        # es. oggi_giallo, oggi_verde, domani_giallo, domani_verde
-        map_files = sorted([f for f in os.listdir(STATIC_MAPS_DIR) if f.endswith('.html')])
-        for f in map_files:
-            # Crea un titolo più leggibile per la visualizzazione nel frontend
-            if f.startswith('map_oggi'):
-                day_prefix = "Oggi"
-            elif f.startswith('map_domani'):
-                day_prefix = "Domani"
-            else:
-                day_prefix = ""
-            
-            risk_color = f.replace(f"map_{day_prefix.lower()}_", "").replace(".html", "").split('_')[-1].upper()
-            generated_maps.append({"filename": f, "title": f"Mappa {day_prefix} - Rischio {risk_color}"})
-            
-    return render_template('index.html', generated_maps=generated_maps)
+    try:
+        mtime_ns = os.stat(REGIONS_CONFIG_PATH).st_mtime_ns
+    except FileNotFoundError:
+        return {DEFAULT_REGION: {"name": "Basilicata", "geojson": GEOJSON_MUNICIPALITIES_PATH,
+                                 "pdf": BOLLETTINO_PDF_PATH, "zone_mapping": None}}
+    with _regions_config_lock:
+        if _regions_config["mtime_ns"] != mtime_ns:
+            with open(REGIONS_CONFIG_PATH, encoding='utf-8') as f:
+                raw = json.load(f)
+            regions = {}
+            for region_id, config in raw.items():
+                if not _REGION_ID_RE.fullmatch(region_id):
+                    raise ValueError(f"Id di regione non valido in {REGIONS_CONFIG_PATH}: {region_id}")
+                regions[region_id] = {"name": config.get("name", region_id), "geojson": config["geojson"],
+                                      "pdf": config["pdf"], "zone_mapping": config.get("zone_mapping")}
+            _regions_config.update(mtime_ns=mtime_ns, regions=regions)
+        return _regions_config["regions"]
 
-@app.route('/process_bulletin', methods=['POST'])
-def process_bulletin():
+def default_region_id():
+    regions = load_regions()
+    return DEFAULT_REGION if DEFAULT_REGION in regions else next(iter(regions))
+
+def get_region(region_id):
     """
-    Endpoint per avviare il processo di lettura e generazione mappe.
+    Configurazione della regione, o None se non è configurata.
+    """
+    return load_regions().get(region_id)
+
+def region_maps_dir(region_id):
+    return os.path.join(STATIC_MAPS_DIR, region_id)
+
+# --- Cache della geometria dei comuni ---
+
+# Copia binaria (GeoParquet) del GeoJSON, molto più veloce da caricare del parser GeoJSON
+GEOMETRY_CACHE_DIR = os.path.join(app.root_path, 'cache', 'geometry')
+
+# Tutto ciò che viene derivato dalla geometria di una regione (comuni, livelli di
+# dettaglio, indici spaziali, geometria delle tile, livelli pubblicati) sta in un'unica
+# cache LRU limitata in memoria: le regioni inattive vengono rimosse per prime,
+# quindi la memoria resta limitata anche aggiungendo regioni.
+REGION_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Stime (approssimate) della memoria occupata, per coordinata
+_COORDINATE_BYTES = 16        # array di coordinate GEOS
+_PREPARED_COORDINATE_BYTES = 48  # geometria preparata con il suo indice interno
+_TOPOLOGY_POINT_BYTES = 120   # punto di un arco come tupla Python di due interi
+_LOOKUP_COMUNE_BYTES = 200    # basi e livelli di un comune nel bollettino pubblicato
+
+def _on_region_cache_evict(key, nbytes):
+    REGION_CACHE_EVICTIONS.inc(kind=key[0])
+    print(f"Rimozione dalla cache delle regioni: {key[0]} {key[1]} ({nbytes / 2**20:.1f} MiB stimati)")
+
+_region_cache = BoundedCache(REGION_CACHE_MAX_BYTES, on_evict=_on_region_cache_evict)
+
+def _gdf_nbytes(gdf):
+    import shapely
+
+    attributes = gdf.drop(columns=gdf.geometry.name).memory_usage(deep=True).sum()
+    return int(attributes + _COORDINATE_BYTES * shapely.get_num_coordinates(gdf.geometry.to_numpy()).sum())
+
+def _file_sha256(path, chunk_size=1 << 20):
+    """
+    Calcola lo SHA-256 di un file leggendolo a blocchi.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _read_binary_geometry(path):
+    import pandas as pd
+    import geopandas as gpd
+
+    if path.endswith('.parquet'):
+        return gpd.read_parquet(path)
+    return pd.read_pickle(path)
+
+def _write_binary_geometry(gdf, path):
+    # Scrittura su file temporaneo e rename atomico: un lettore concorrente
+    # non vede mai un file scritto a metà
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    if path.endswith('.parquet'):
+        gdf.to_parquet(tmp_path)
+    else:
+        gdf.to_pickle(tmp_path)
+    os.replace(tmp_path, path)
+
+def _load_municipalities_from_disk(geojson_path, sha256):
+    """
+    Carica i comuni dalla copia binaria su disco se è aggiornata, altrimenti
+    legge il GeoJSON e rigenera la copia binaria.
+    """
+    import geopandas as gpd
+
+    os.makedirs(GEOMETRY_CACHE_DIR, exist_ok=True)
+    # Il nome include un hash del percorso assoluto: GeoJSON di regioni diverse con
+    # lo stesso nome file (es. regions/a/comuni.geojson e regions/b/comuni.geojson)
+    # hanno copie distinte e non si cancellano a vicenda
+    base_name = os.path.splitext(os.path.basename(geojson_path))[0]
+    path_hash = hashlib.sha256(os.path.abspath(geojson_path).encode()).hexdigest()[:12]
+    cache_prefix = f"{base_name}_{path_hash}_"
+    extension = 'parquet' if importlib.util.find_spec('pyarrow') else 'pkl'
+    cache_name = f"{cache_prefix}{sha256[:16]}.{extension}"
+    cache_path = os.path.join(GEOMETRY_CACHE_DIR, cache_name)
+
+    if os.path.exists(cache_path):
+        try:
+            with STAGE_SECONDS.time(stage="geometry_load_binary"):
+                gdf = _read_binary_geometry(cache_path)
+            CACHE_REQUESTS.inc(cache="geometry_disk", result="hit")
+            return gdf
+        except Exception as e:
+            print(f"Cache geometria {cache_path} illeggibile, la rigenero: {e}")
+
+    CACHE_REQUESTS.inc(cache="geometry_disk", result="miss")
+    print(f"Caricamento del GeoJSON dei comuni da: {geojson_path}")
+    with STAGE_SECONDS.time(stage="geometry_load_geojson"):
+        gdf = gpd.read_file(geojson_path)
+    try:
+        _write_binary_geometry(gdf, cache_path)
+    except Exception as e:
+        print(f"Impossibile scrivere la cache geometria {cache_path}: {e}")
+        return gdf
+
+    # Rimuove le copie binarie di versioni precedenti dello stesso GeoJSON
+    for f in os.listdir(GEOMETRY_CACHE_DIR):
+        if f.startswith(cache_prefix) and f != cache_name:
+            try:
+                os.unlink(os.path.join(GEOMETRY_CACHE_DIR, f))
+            except OSError:
+                pass
+    return gdf
+
+def _municipalities_entry(geojson_path):
+    abs_path = os.path.abspath(geojson_path)
+    stat = os.stat(abs_path)
+    key = ("municipalities", abs_path)
+
+    entry = _region_cache.get(key)
+    if entry and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+        CACHE_REQUESTS.inc(cache="geometry_memory", result="hit")
+        return entry
+
+    # Lock per file: il caricamento di una regione non blocca le altre
+    with _region_cache.key_lock(key):
+        entry = _region_cache.get(key)
+        if entry and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+            CACHE_REQUESTS.inc(cache="geometry_memory", result="hit")
+            return entry
+
+        sha256 = _file_sha256(abs_path)
+        if entry and entry["sha256"] == sha256:
+            # File "toccato" ma contenuto identico: aggiorna solo i metadati
+            entry["mtime_ns"], entry["size"] = stat.st_mtime_ns, stat.st_size
+            CACHE_REQUESTS.inc(cache="geometry_memory", result="hit")
+            return entry
+
+        CACHE_REQUESTS.inc(cache="geometry_memory", result="miss")
+        gdf = _load_municipalities_from_disk(abs_path, sha256)
+        entry = {
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "sha256": sha256,
+            "gdf": gdf,
+        }
+        _region_cache.put(key, entry, _gdf_nbytes(gdf))
+        return entry
+
+def load_municipalities(geojson_path):
+    """
+    Restituisce il GeoDataFrame dei comuni, caricato una sola volta per processo
+    (finché resta nella cache delle regioni).
+    La cache viene invalidata quando cambiano mtime/dimensione del GeoJSON e, se
+    cambia anche il contenuto (SHA-256), viene rigenerata la copia binaria su disco.
+    Il GeoDataFrame restituito è condiviso: chi deve modificarlo ne faccia una copia.
+    """
+    return _municipalities_entry(geojson_path)["gdf"]
+
+def municipalities_sha256(geojson_path):
+    """
+    Restituisce lo SHA-256 del GeoJSON dei comuni: identifica la versione della
+    geometria. Non carica la geometria (e le librerie geografiche) se non è già in cache.
+    """
+    abs_path = os.path.abspath(geojson_path)
+    stat = os.stat(abs_path)
+    entry = _region_cache.get(("municipalities", abs_path))
+    if entry and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+        return entry["sha256"]
+    return _stat_file_sha256(abs_path, stat.st_mtime_ns, stat.st_size)
+
+@functools.lru_cache(maxsize=64)
+def _stat_file_sha256(path, mtime_ns, size):
+    # mtime e dimensione fanno parte della chiave: un file modificato viene riletto
+    return _file_sha256(path)
+
+def load_zone_mapping(path):
+    """
+    Mappatura Comune -> zone di allerta di una regione, da un file JSON
+    {comune: [zona, ...] oppure "A1-B"}; letta una volta e conservata nella cache
+    delle regioni finché il file non cambia.
+    """
+    abs_path = os.path.abspath(path)
+    mtime_ns = os.stat(abs_path).st_mtime_ns
+    key = ("zones", abs_path)
+    cached = _region_cache.get(key)
+    if cached is not None and cached["mtime_ns"] == mtime_ns:
+        return cached["mapping"]
+    with _region_cache.key_lock(key):
+        cached = _region_cache.get(key)
+        if cached is not None and cached["mtime_ns"] == mtime_ns:
+            return cached["mapping"]
+        with open(abs_path, encoding='utf-8') as f:
+            raw = json.load(f)
+        mapping = {
+            comune: [zone.strip() for zone in (zones.split('-') if isinstance(zones, str) else zones)]
+            for comune, zones in raw.items()
+        }
+        _region_cache.put(key, {"mtime_ns": mtime_ns, "mapping": mapping}, _LOOKUP_COMUNE_BYTES * len(mapping))
+        return mapping
+
+# --- Cache dei risultati (indirizzata per contenuto) ---
+
+RESULTS_CACHE_DIR = os.path.join(app.root_path, 'cache', 'results')
+RESULTS_CACHE_MAX_ENTRIES = 30
+RESULTS_CACHE_MAX_BYTES = 200 * 1024 * 1024
+
+_results_cache_lock = threading.Lock()
+_code_sha256 = None
+
+def _code_version():
+    # Le mappe dipendono da questo modulo e da topology.py (livelli della geometria e TopoJSON)
+    global _code_sha256
+    if _code_sha256 is None:
+        digests = [_file_sha256(path) for path in (os.path.abspath(__file__), TOPOLOGY_MODULE_PATH)]
+        _code_sha256 = hashlib.sha256("|".join(digests).encode()).hexdigest()
+    return _code_sha256
+
+def _results_cache_key(pdf_path, geojson_path, zone_mapping_path=None):
+    """
+    Chiave della cache dei risultati: SHA-256 del PDF, versione della geometria,
+    eventuale mappatura delle zone della regione, versione del codice (hash di
+    questo modulo e di topology.py), modalità di rendering e data di elaborazione, perché i titoli delle mappe riportano
+    le date di oggi e domani.
     """
+    parts = [
+        _file_sha256(pdf_path),
+        municipalities_sha256(geojson_path),
+        _code_version(),
+        MAP_RENDER_MODE,
+        datetime.now().strftime('%Y-%m-%d'),
+    ]
+    if zone_mapping_path:
+        parts.append(_file_sha256(zone_mapping_path))
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()
+
+def _dir_size(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+def _copy_or_link(source_path, target_path):
+    # Gli artefatti sono immutabili: un hard link evita la copia quando possibile
+    try:
+        os.link(source_path, target_path)
+    except OSError:
+        shutil.copyfile(source_path, target_path)
+
+def load_cached_result(key, output_dir):
+    """
+    Se esiste un risultato in cache per `key`, ne copia le mappe in `output_dir`
+    (una generazione nuova, non ancora pubblicata) e ne restituisce il manifest
+    ({"maps", "bulletin", "levels", "names", "map_levels"}); altrimenti restituisce None.
+    """
+    entry_dir = os.path.join(RESULTS_CACHE_DIR, key)
+    manifest_path = os.path.join(entry_dir, 'manifest.json')
+    with _results_cache_lock:
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        for map_info in manifest["maps"]:
+            for source_path in precompressed_variants(os.path.join(entry_dir, map_info["filename"])):
+                _copy_or_link(source_path, os.path.join(output_dir, os.path.basename(source_path)))
+        # Aggiorna l'mtime: l'evizione rimuove le voci usate meno di recente
+        os.utime(manifest_path)
+    return manifest
+
+def store_cached_result(key, maps, source_dir, bulletin=None, details=None):
+    """
+    Salva in cache le mappe generate (file HTML più manifest, con i dati estratti
+    dal bollettino ed eventuali `details`, es. i livelli per comune) ed evita che la
+    cache superi RESULTS_CACHE_MAX_ENTRIES voci o RESULTS_CACHE_MAX_BYTES byte.
+    """
+    entry_dir = os.path.join(RESULTS_CACHE_DIR, key)
+    tmp_dir = f"{entry_dir}.{os.getpid()}.{threading.get_ident()}.tmp"
+    os.makedirs(tmp_dir, exist_ok=True)
+    for map_info in maps:
+        for source_path in precompressed_variants(os.path.join(source_dir, map_info["filename"])):
+            _copy_or_link(source_path, os.path.join(tmp_dir, os.path.basename(source_path)))
+    with open(os.path.join(tmp_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump({**(details or {}), "maps": maps, "bulletin": bulletin, "created": datetime.now().isoformat()}, f)
+
+    with _results_cache_lock:
+        if os.path.exists(entry_dir):
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        else:
+            os.rename(tmp_dir, entry_dir)
+        _evict_results_cache()
+
+def _evict_results_cache():
+    entries = []
+    for entry in os.scandir(RESULTS_CACHE_DIR):
+        manifest_path = os.path.join(entry.path, 'manifest.json')
+        if entry.is_dir() and os.path.exists(manifest_path):
+            entries.append((os.path.getmtime(manifest_path), _dir_size(entry.path), entry.path))
+    entries.sort(reverse=True)  # Dalla più recente alla meno recente
+
+    total_bytes = 0
+    for position, (_, size, path) in enumerate(entries):
+        total_bytes += size
+        if position >= RESULTS_CACHE_MAX_ENTRIES or total_bytes > RESULTS_CACHE_MAX_BYTES:
+            print(f"Rimozione dalla cache dei risultati: {path}")
+            shutil.rmtree(path, ignore_errors=True)
+
+# --- Pubblicazione versionata delle mappe ---
+
+# Ogni elaborazione scrive in una nuova directory STATIC_MAPS_DIR/<generazione>/;
+# il file puntatore CURRENT_MAPS_POINTER indica la generazione pubblicata e viene
+# sostituito atomicamente, quindi index() e serve_map non vedono mai un set parziale.
+CURRENT_MAPS_POINTER = 'current.json'
+MAPS_GENERATIONS_TO_KEEP = 5  # Generazioni precedenti conservate per il rollback
+
+_publish_lock = threading.Lock()
+
+def new_maps_generation(maps_dir):
+    """
+    Crea una directory vuota per una nuova generazione di mappe e ne restituisce l'id.
+    """
+    generation = f"{datetime.now().strftime('%Y%m%dT%H%M%S%f')}-{uuid.uuid4().hex[:6]}"
+    os.makedirs(os.path.join(maps_dir, generation))
+    return generation
+
+def _write_json_atomic(path, data):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def publish_maps_generation(maps_dir, generation, maps=None, bulletin=None, details=None):
+    """
+    Pubblica una generazione: scrive il suo manifest (se `maps` è indicato), con
+    i dati estratti dal bollettino e gli eventuali `details` (livelli per comune,
+    modifiche rispetto alla generazione precedente), e sposta atomicamente il
+    puntatore su di essa. Chiamata con l'id di una generazione precedente ancora
+    conservata, esegue un rollback. Restituisce il manifest pubblicato, con i
+    filename relativi a `maps_dir`.
+    """
+    generation_dir = os.path.join(maps_dir, generation)
+    manifest_path = os.path.join(generation_dir, 'manifest.json')
+    if maps is not None:
+        _write_json_atomic(manifest_path, {**(details or {}), "generation": generation, "maps": maps, "bulletin": bulletin})
+    with open(manifest_path, encoding='utf-8') as f:
+        generation_manifest = json.load(f)
+
+    manifest = dict(
+        generation_manifest,
+        generation=generation,
+        published=datetime.now().isoformat(),
+        maps=[dict(map_info, filename=f"{generation}/{map_info['filename']}")
+              for map_info in generation_manifest["maps"]],
+        bulletin=generation_manifest.get("bulletin"),
+    )
+    with _publish_lock:
+        previous = read_published_maps(maps_dir)
+        _write_json_atomic(os.path.join(maps_dir, CURRENT_MAPS_POINTER), manifest)
+        _prune_maps_generations(maps_dir, keep=generation)
+        if previous and previous["generation"] != generation:
+            _invalidate_tile_cache(previous["generation"])
+    return manifest
+
+def _prune_maps_generations(maps_dir, keep):
+    generations = sorted(
+        (entry.name for entry in os.scandir(maps_dir)
+         if entry.is_dir() and os.path.exists(os.path.join(entry.path, 'manifest.json'))),
+        reverse=True,
+    )
+    for generation in generations[MAPS_GENERATIONS_TO_KEEP + 1:]:
+        if generation != keep:
+            shutil.rmtree(os.path.join(maps_dir, generation), ignore_errors=True)
+            # Tile eventualmente scritte dopo l'invalidazione (vedi cached_vector_tile_path)
+            _invalidate_tile_cache(generation)
+
+def read_published_maps(maps_dir):
+    """
+    Restituisce il manifest della generazione pubblicata, o None se non ce n'è.
+    """
+    try:
+        with open(os.path.join(maps_dir, CURRENT_MAPS_POINTER), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+# --- Pipeline di elaborazione del bollettino ---
+
+def _planned_day_maps(gdf, title_suffix, output_dir, file_prefix, geometry_levels, geometry_version):
+    """
+    Mappe di un giorno come [{"level", "map_info", "task"}]: "level" è il livello
+    di rischio rappresentato (None se la mappa li contiene tutti), "map_info" le
+    informazioni che il rendering restituirà e "task" il task di rendering.
+    """
+    if MAP_RENDER_MODE == 'shared':
+        # La mappa giornaliera usa solo i livelli: non serve inviare la geometria al worker
+        return [{
+            "level": None,
+            "map_info": {"filename": f"{file_prefix}.html", "title": f"Mappa {title_suffix}"},
+            "task": (create_daily_map, (gdf[['criticity_level_numeric']], title_suffix, output_dir, file_prefix, geometry_levels)),
+        }]
+    planned = []
+    for render, args in styled_map_tasks(gdf, title_suffix, output_dir, file_prefix, geometry_version=geometry_version):
+        risk_color = args[1]
+        planned.append({
+            "level": get_criticity_level_numeric(risk_color),
+            "map_info": {"filename": f"{file_prefix}_{risk_color.lower()}.html",
+                         "title": f"Mappa {title_suffix} - Rischio {risk_color}"},
+            "task": (render, args),
+        })
+    return planned
+
+# --- Elaborazione incrementale ---
+
+def _render_key(geometry_version):
+    """
+    Ciò da cui dipende il contenuto delle mappe oltre ai livelli dei comuni:
+    versione del codice, modalità di rendering e geometria. Una mappa della
+    generazione precedente è riutilizzabile solo se la chiave è la stessa.
+    """
+    parts = [_code_version(), MAP_RENDER_MODE, geometry_version]
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()[:16]
+
+def _map_unchanged(level, previous_levels, levels):
+    """
+    Vero se la mappa del `level` indicato (None: tutti i livelli) mostrerebbe gli
+    stessi comuni con gli stessi livelli.
+    """
+    import numpy as np
+
+    previous_levels, levels = np.asarray(previous_levels), np.asarray(levels)
+    if previous_levels.shape != levels.shape:
+        return False
+    if level is None:
+        return bool((previous_levels == levels).all())
+    return bool(((previous_levels == level) == (levels == level)).all())
+
+def _same_as_previous_map(previous, map_info, day, level, levels):
+    """
+    Vero se la generazione precedente (`previous`, confrontabile: stessa
+    geometria e stessa chiave di rendering) contiene la mappa `map_info` del
+    giorno `day` con lo stesso titolo (es. stessa data del bollettino) e con gli
+    stessi comuni e livelli, cioè con lo stesso contenuto.
+    """
+    previous_titles = {m["filename"]: m["title"] for m in previous["maps"]}
+    if previous_titles.get(f"{previous['generation']}/{map_info['filename']}") != map_info["title"]:
+        return False
+    return _map_unchanged(level, previous["levels"][day], levels[day])
+
+def _reuse_previous_map(maps_dir, previous, map_info, generation_dir):
+    """
+    Collega nella nuova generazione la mappa `map_info` (con le varianti
+    precompresse) della generazione precedente. Restituisce False se il file non
+    esiste più.
+    """
+    source_path = os.path.join(maps_dir, previous["generation"], map_info["filename"])
+    try:
+        for path in precompressed_variants(source_path):
+            _copy_or_link(path, os.path.join(generation_dir, os.path.basename(path)))
+    except OSError:
+        return False
+    return True
+
+def bulletin_changes(previous, bulletin, levels, names, geometry_version):
+    """
+    Modifiche rispetto al bollettino pubblicato in precedenza (`previous`, il
+    manifest di read_published_maps): per ogni giorno ("oggi", "domani") le basi e
+    i comuni che cambiano livello, con il colore precedente e quello nuovo.
+    None se non c'è un bollettino precedente confrontabile (stessa geometria).
+    """
+    import numpy as np
+
+    if not previous or previous.get("geometry_version") != geometry_version or not previous.get("levels"):
+        return None
+    previous_bulletin = previous.get("bulletin") or {}
+    days = {}
+    for day, bases_key, date_key in (("oggi", "today", "today_date"), ("domani", "tomorrow", "tomorrow_date")):
+        old_bases, new_bases = previous_bulletin.get(bases_key) or {}, bulletin[bases_key] or {}
+        old_levels, new_levels = np.asarray(previous["levels"][day]), np.asarray(levels[day])
+        changed = np.flatnonzero(old_levels != new_levels)
+        days[day] = {
+            "previous_date": previous_bulletin.get(date_key),
+            "date": bulletin[date_key],
+            "bases": [{"base": base, "from": old_bases.get(base), "to": new_bases.get(base)}
+                      for base in sorted(set(old_bases) | set(new_bases))
+                      if old_bases.get(base) != new_bases.get(base)],
+            "comuni": [{"comune": names[i],
+                        "from": CRITICITY_COLORS_BY_LEVEL[int(old_levels[i])],
+                        "to": CRITICITY_COLORS_BY_LEVEL[int(new_levels[i])]}
+                       for i in changed.tolist()],
+        }
+    return {"from_generation": previous["generation"], "days": days}
+
+# --- Rendering parallelo delle mappe ---
+
+# Pool di processi condiviso tra le richieste, creato al primo uso: l'avvio dei worker
+# e l'import di folium si pagano una sola volta. Con 1 worker si renderizza in linea.
+RENDER_WORKERS = min(4, os.cpu_count() or 1)
+
+_render_executor = None
+_render_executor_lock = threading.Lock()
+
+def get_render_executor():
+    """
+    Restituisce il pool di processi per il rendering (None se RENDER_WORKERS <= 1).
+    """
+    global _render_executor
+    with _render_executor_lock:
+        if _render_executor is None and RENDER_WORKERS > 1:
+            # "spawn": i worker non ereditano thread e lock del server web
+            _render_executor = ProcessPoolExecutor(max_workers=RENDER_WORKERS,
+                                                   mp_context=multiprocessing.get_context('spawn'))
+        return _render_executor
+
+def _reset_render_executor(broken_executor):
+    global _render_executor
+    with _render_executor_lock:
+        if _render_executor is broken_executor:
+            _render_executor = None
+    broken_executor.shutdown(wait=False, cancel_futures=True)
+
+def _run_render_task(render, args):
+    # Eseguita nel worker: le metriche del rendering tornano al processo principale
+    with metrics.capture() as records:
+        maps = render(*args)
+    return maps, records
+
+def render_maps(tasks, in_process=False):
+    """
+    Esegue i task di rendering (funzione, argomenti) nel pool di processi, uno per
+    mappa, e restituisce le informazioni delle mappe nell'ordine dei task.
+    Se il pool non è disponibile o si rompe, o se `in_process` è vero, il rendering
+    avviene in questo processo.
+    """
+    executor = None if in_process else get_render_executor()
+    if executor is not None:
+        try:
+            futures = [executor.submit(_run_render_task, render, args) for render, args in tasks]
+            all_maps = []
+            for future in futures:
+                maps, records = future.result()
+                metrics.replay(records)
+                all_maps.extend(maps)
+            return all_maps
+        except BrokenProcessPool as e:
+            print(f"Pool di rendering non disponibile, rendering nel processo corrente: {e}")
+            _reset_render_executor(executor)
+    return [map_info for render, args in tasks for map_info in render(*args)]
+
+def url_for_geometry(filename):
+    """
+    URL dell'asset di geometria; costruito senza contesto di richiesta perché
+    la pipeline gira nei worker della coda dei job.
+    """
+    return f"/geometry/{filename}"
+
+def run_bulletin_pipeline(pdf_path, geojson_path, maps_dir, render_in_process=False, zone_mapping_path=None,
+                          progress=None):
+    """
+    Esegue l'intera elaborazione di un bollettino, pubblica la nuova generazione
+    di mappe e restituisce il corpo della risposta JSON:
+    {"status": "success", "message", "generation", "maps", "changes"} oppure
+    {"status": "error", "message"}. Se il bollettino non contiene la tabella dei
+    comuni viene usata la mappatura `zone_mapping_path` della regione, se indicata.
+    `progress`, se indicata, viene chiamata con (fase, dettagli) all'inizio delle
+    fasi principali.
+    """
+    with STAGE_SECONDS.time(stage="pipeline"):
+        result = _run_bulletin_pipeline(pdf_path, geojson_path, maps_dir, render_in_process, zone_mapping_path,
+                                        progress)
+    if result["status"] != "success":
+        PIPELINE_RUNS.inc(result="error")
+    else:
+        PIPELINE_RUNS.inc(result="cached" if result.get("cached") else "rendered")
+    return result
+
+def _report_progress(progress, stage, **details):
+    if progress is not None:
+        progress(stage, details)
+
+def _run_bulletin_pipeline(pdf_path, geojson_path, maps_dir, render_in_process, zone_mapping_path, progress):
+    generation = None
     try:
         # --- Scarica/Accedi al Bollettino ---
         # In un'applicazione reale, qui ci sarebbe la logica per scaricare il PDF
         # dal sito web ufficiale. Per ora, si assume che il file sia presente.
-        if not os.path.exists(BOLLETTINO_PDF_PATH):
-            return jsonify({"status": "error", "message": f"File bollettino PDF non trovato in {BOLLETTINO_PDF_PATH}. Assicurati che sia presente."}), 500
+        if not os.path.exists(pdf_path):
+            return {"status": "error", "message": f"File bollettino PDF non trovato in {pdf_path}. Assicurati che sia presente."}
+        if not os.path.exists(geojson_path):
+            return {"status": "error", "message": f"File GeoJSON dei comuni non trovato: {geojson_path}"}
         
-        print(f"Accesso al bollettino: {BOLLETTINO_PDF_PATH}")
+        print(f"Accesso al bollettino: {pdf_path}")
+
+        geometry_version = municipalities_sha256(geojson_path)
+
+        # Generazione pubblicata finora: base per il confronto e per il riuso delle mappe
+        previous = read_published_maps(maps_dir)
+        render_key = _render_key(geometry_version)
+
+        # 0. Stesso bollettino, stessa geometria e stesso codice: riusa il risultato in cache
+        cache_key = _results_cache_key(pdf_path, geojson_path, zone_mapping_path)
+        generation = new_maps_generation(maps_dir)
+        generation_dir = os.path.join(maps_dir, generation)
+        with STAGE_SECONDS.time(stage="results_cache_load"):
+            cached = load_cached_result(cache_key, generation_dir)
+        if cached is not None:
+            CACHE_REQUESTS.inc(cache="results", result="hit")
+            print(f"Risultato trovato in cache ({cache_key[:12]}).")
+            if MAP_RENDER_MODE == 'shared' and not _geometry_assets_written(geometry_version):
+                # Asset rimossi dopo il salvataggio in cache: le mappe li richiedono
+                write_geometry_assets(load_municipalities(geojson_path), GEOMETRY_ASSETS_DIR, geometry_version)
+            changes = None
+            if cached.get("levels") is not None and cached.get("names") is not None:
+                changes = bulletin_changes(previous, cached["bulletin"], cached["levels"], cached["names"],
+                                           geometry_version)
+            if changes is not None:
+                # Le mappe vengono dalla cache: per i client sono "riprese" solo quelle
+                # identiche alla generazione precedente, le altre vanno ricaricate
+                map_levels = cached.get("map_levels") or {}
+                reusable = previous.get("render_key") == render_key
+                changes["maps"] = {"rerendered": [], "reused": []}
+                for map_info in cached["maps"]:
+                    day_level = map_levels.get(map_info["filename"])
+                    unchanged = (reusable and day_level is not None
+                                 and _same_as_previous_map(previous, map_info, day_level[0], day_level[1],
+                                                           cached["levels"]))
+                    changes["maps"]["reused" if unchanged else "rerendered"].append(map_info["filename"])
+            details = {"levels": cached.get("levels"), "geometry_version": geometry_version,
+                       "render_key": render_key, "changes": changes}
+            with STAGE_SECONDS.time(stage="publish"):
+                manifest = publish_maps_generation(maps_dir, generation, cached["maps"], cached.get("bulletin"), details)
+            generation = None
+            return {"status": "success", "message": "Mappe generate con successo (da cache).",
+                    "generation": manifest["generation"], "maps": manifest["maps"], "cached": True,
+                    "changes": changes}
+        CACHE_REQUESTS.inc(cache="results", result="miss")
 
         # 1. Estrai tutte le informazioni rilevanti dal PDF
-        bases_criticity_today, bases_criticity_tomorrow, comune_to_bases_mapping = extract_data_from_pdf(BOLLETTINO_PDF_PATH)
+        _report_progress(progress, "extract")
+        try:
+            bulletin = extract_bulletin(pdf_path)
+        except Exception as e:
+            print(f"Errore durante l'estrazione dati dal PDF: {e}")
+            bulletin = {"today": {}, "tomorrow": {}, "today_date": None, "tomorrow_date": None, "comune_to_bases_mapping": {}}
+        bases_criticity_today = bulletin["today"]
+        bases_criticity_tomorrow = bulletin["tomorrow"]
+        if not bulletin["comune_to_bases_mapping"] and zone_mapping_path:
+            # Bollettino senza tabella dei comuni: mappatura statica della regione
+            bulletin["comune_to_bases_mapping"] = load_zone_mapping(zone_mapping_path)
+        comune_to_bases_mapping = bulletin["comune_to_bases_mapping"]
+        # Le date dei titoli sono quelle del bollettino; in mancanza, quelle di elaborazione
+        today_label = bulletin["today_date"] or datetime.now().strftime('%d/%m/%Y')
+        tomorrow_label = bulletin["tomorrow_date"] or (datetime.now() + timedelta(days=1)).strftime('%d/%m/%Y')
         
         if not bases_criticity_today and not bases_criticity_tomorrow:
-            return jsonify({"status": "error", "message": "Nessuna criticità per oggi o domani estratta dal PDF. Controlla il formato del bollettino."}), 500
+            return {"status": "error", "message": "Nessuna criticità per oggi o domani estratta dal PDF. Controlla il formato del bollettino."}
         if not comune_to_bases_mapping:
-            return jsonify({"status": "error", "message": "Nessuna mappatura Comune-Basi estratta dal PDF. Controlla il formato del bollettino."}), 500
+            return {"status": "error", "message": "Nessuna mappatura Comune-Basi estratta dal PDF. Controlla il formato del bollettino."}
         
         print("Criticità Basi Oggi:", bases_criticity_today)
         print("Criticità Basi Domani:", bases_criticity_tomorrow)
         print("Mappatura Comune-Basi (primi 5):", dict(list(comune_to_bases_mapping.items())[:5]))
 
-        # 2. Carica il GeoJSON dei comuni
-        print(f"Caricamento del GeoJSON dei comuni da: {GEOJSON_MUNICIPALITIES_PATH}")
-        if not os.path.exists(GEOJSON_MUNICIPALITIES_PATH):
-            return jsonify({"status": "error", "message": f"File GeoJSON dei comuni non trovato: {GEOJSON_MUNICIPALITIES_PATH}"}), 500
-        
-        municipalities_gdf = gpd.read_file(GEOJSON_MUNICIPALITIES_PATH)
+        # 2. Carica il GeoJSON dei comuni (dalla cache di processo)
+        with STAGE_SECONDS.time(stage="geometry_load"):
+            municipalities_gdf = load_municipalities(geojson_path)
         print(f"Caricati {len(municipalities_gdf)} comuni.")
 
-        # 3. Pulisci la directory delle mappe precedenti
-        for f in os.listdir(STATIC_MAPS_DIR):
-            file_path = os.path.join(STATIC_MAPS_DIR, f)
-            try:
-                if os.path.isfile(file_path):
-                    os.unlink(file_path)
-            except Exception as e:
-                print(f"Errore durante la pulizia del file {file_path}: {e}")
-        
-        all_generated_maps = []
-
-        # 4. Assegna e crea le mappe per OGGI
-        print("\nElaborazione e creazione mappe per OGGI...")
-        municipalities_today = assign_municipalities_criticity(municipalities_gdf.copy(), bases_criticity_today, comune_to_bases_mapping)
-        all_generated_maps.extend(
-            create_styled_map(municipalities_today, 
-                              f"Oggi ({datetime
+        # Geometria condivisa dalle mappe giornaliere (scritta una volta per versione)
+        geometry_levels = None
+        if MAP_RENDER_MODE == 'shared':
+            with STAGE_SECONDS.time(stage="geometry_assets"):
+                geometry_levels = [
+                    {"max_zoom": asset["max_zoom"], "url": url_for_geometry(asset["filename"])}
+                    for asset in write_geometry_assets(municipalities_gdf, GEOMETRY_ASSETS_DIR, geometry_version)
+                ]
+
+        # 3. Assegna la criticità ai comuni per OGGI e DOMANI
+        print("\nElaborazione mappe per OGGI e DOMANI...")
+        with STAGE_SECONDS.time(stage="criticity_assign"):
+            day_levels = compute_municipalities_criticity(
+                municipalities_gdf['name'], {"oggi": bases_criticity_today, "domani": bases_criticity_tomorrow},
+                comune_to_bases_mapping)
+            # Copie superficiali: le colonne aggiunte non toccano il GeoDataFrame in
+            # cache e la geometria non viene copiata
+            municipalities_today = set_criticity_columns(municipalities_gdf.copy(deep=False), day_levels["oggi"])
+            municipalities_tomorrow = set_criticity_columns(municipalities_gdf.copy(deep=False), day_levels["domani"])
+
+        levels = {day: day_levels[day].tolist() for day in ("oggi", "domani")}
+        names = municipalities_gdf['name'].tolist()
+        changes = bulletin_changes(previous, bulletin, levels, names, geometry_version)
+
+        # 4. Crea le mappe (una per giorno e livello di rischio) in parallelo, nella
+        # directory della nuova generazione. Le mappe che mostrerebbero gli stessi
+        # comuni con gli stessi livelli vengono riprese dalla generazione precedente.
+        planned = (
+            [dict(plan, day="oggi") for plan in _planned_day_maps(
+                municipalities_today, f"Oggi ({today_label})",
+                generation_dir, "map_oggi", geometry_levels, geometry_version)]
+            + [dict(plan, day="domani") for plan in _planned_day_maps(
+                municipalities_tomorrow, f"Domani ({tomorrow_label})",
+                generation_dir, "map_domani", geometry_levels, geometry_version)]
+        )
+        reusable = (changes is not None and previous.get("render_key") == render_key)
+        to_render, reused = [], []
+        for plan in planned:
+            if (reusable
+                    and _same_as_previous_map(previous, plan["map_info"], plan["day"], plan["level"], levels)
+                    and _reuse_previous_map(maps_dir, previous, plan["map_info"], generation_dir)):
+                reused.append(plan["map_info"]["filename"])
+            else:
+                to_render.append(plan)
+        if reused:
+            MAPS_REUSED.inc(len(reused))
+            print(f"Mappe invariate riprese dalla generazione {previous['generation']}: {', '.join(reused)}")
+        _report_progress(progress, "render", to_render=len(to_render), reused=len(reused))
+        with STAGE_SECONDS.time(stage="render_maps"):
+            rendered = render_maps([plan["task"] for plan in to_render], in_process=render_in_process)
+        # Le mappe restano nell'ordine previsto (oggi prima di domani, rischio decrescente)
+        generated = {map_info["filename"] for map_info in rendered} | set(reused)
+        all_generated_maps = [plan["map_info"] for plan in planned if plan["map_info"]["filename"] in generated]
+        if changes is not None:
+            changes["maps"] = {"rerendered": [plan["map_info"]["filename"] for plan in to_render], "reused": reused}
+        details = {"levels": levels, "geometry_version": geometry_version, "render_key": render_key, "changes": changes}
+
+        # 5. Salva il risultato nella cache
+        try:
+            with STAGE_SECONDS.time(stage="results_cache_store"):
+                store_cached_result(cache_key, all_generated_maps, generation_dir, bulletin,
+                                    {"levels": levels, "names": names,
+                                     "map_levels": {plan["map_info"]["filename"]: [plan["day"], plan["level"]]
+                                                    for plan in planned}})
+        except Exception as e:
+            print(f"Impossibile salvare il risultato nella cache: {e}")
+
+        # 6. Pubblica la nuova generazione (scambio atomico del puntatore)
+        _report_progress(progress, "publish")
+        with STAGE_SECONDS.time(stage="publish"):
+            manifest = publish_maps_generation(maps_dir, generation, all_generated_maps, bulletin, details)
+        generation = None
+        return {"status": "success", "message": "Mappe generate con successo.",
+                "generation": manifest["generation"], "maps": manifest["maps"], "changes": changes}
+
+    except Exception as e:
+        print(f"Errore durante l'elaborazione del bollettino: {e}")
+        return {"status": "error", "message": f"Errore durante l'elaborazione: {e}"}
+
+    finally:
+        # Una generazione non pubblicata (errore o uscita anticipata) viene scartata
+        if generation is not None:
+            shutil.rmtree(os.path.join(maps_dir, generation), ignore_errors=True)
+
+# --- Coda dei job di elaborazione ---
+
+JOB_WORKERS = 4         # Job in esecuzione contemporaneamente, in tutte le regioni
+JOB_REGION_WORKERS = 2  # Per regione: una regione con molti job in coda non occupa tutti i thread
+JOBS_MAX_FINISHED = 200  # Job conclusi conservati per la consultazione su /jobs/<id>
+
+# Directory dei profili cProfile dei job avviati con /process_bulletin?profile=1;
+# se non è impostata la profilazione è disabilitata
+PROFILES_DIR = os.environ.get('BOLLETTINO_PROFILE_DIR')
+
+# Server degli eventi SSE (avanzamento dei job e nuove generazioni pubblicate),
+# avviato alla prima richiesta nel processo che la serve (anche sotto un server
+# WSGI); la porta 0 lo disabilita e la pagina torna a interrogare /jobs/<id>.
+# Con l'host predefinito (loopback) il server è raggiungibile solo tramite un
+# reverse proxy, il cui indirizzo pubblico va indicato in EVENTS_URL (es. "/events");
+# con un host pubblico (es. 0.0.0.0) la pagina lo raggiunge sulla porta EVENTS_PORT.
+EVENTS_HOST = os.environ.get('BOLLETTINO_EVENTS_HOST', '127.0.0.1')
+EVENTS_PORT = int(os.environ.get('BOLLETTINO_EVENTS_PORT', '5001'))
+EVENTS_URL = os.environ.get('BOLLETTINO_EVENTS_URL')
+
+_event_server_started = False
+_event_server_lock = threading.Lock()
+
+_job_executor = None  # Pool di thread condiviso dei job, creato al primo job
+_region_running = {}  # regione -> numero di job affidati al pool (al più JOB_REGION_WORKERS)
+_region_waiting = {}  # regione -> deque dei job in attesa che si liberi un posto della regione
+_jobs = {}            # id -> job
+_inflight_jobs = {}   # (regione, chiave del bollettino) -> id del job in coda o in esecuzione
+_jobs_lock = threading.Lock()
+
+def _job_public_view(job):
+    return {key: job[key] for key in ("job_id", "region", "state", "stage", "created", "started", "finished",
+                                      "result", "profile")}
+
+def _publish_job_event(job, **details):
+    events.publish(job["region"], "job", {"job_id": job["job_id"], "state": job["state"], "stage": job["stage"], **details})
+
+def _run_job(job, region):
+    # Qualunque cosa accada, il job deve concludersi e liberare la chiave del
+    # bollettino: altrimenti le richieste successive resterebbero agganciate a
+    # un job che non termina mai
+    result = {"status": "error", "message": "Elaborazione interrotta."}
+    try:
+        with _jobs_lock:
+            job["state"] = "running"
+            job["started"] = datetime.now().isoformat()
+        _publish_job_event(job)
+
+        def progress(stage, details):
+            with _jobs_lock:
+                job["stage"] = stage
+            _publish_job_event(job, **details)
+
+        args = (region["pdf"], region["geojson"], region_maps_dir(job["region"]))
+        if job["profile"]:
+            # Rendering in questo thread, così il profilo include anche folium
+            with metrics.profile_to(os.path.join(PROFILES_DIR, job["profile"])):
+                result = run_bulletin_pipeline(*args, render_in_process=True, zone_mapping_path=region["zone_mapping"],
+                                               progress=progress)
+        else:
+            result = run_bulletin_pipeline(*args, zone_mapping_path=region["zone_mapping"], progress=progress)
+    except Exception as e:
+        print(f"Errore durante l'esecuzione del job {job['job_id']}: {e}")
+        result = {"status": "error", "message": f"Errore durante l'elaborazione: {e}"}
+    finally:
+        result["region"] = job["region"]
+        with _jobs_lock:
+            job["result"] = result
+            job["state"] = "done" if result["status"] == "success" else "failed"
+            job["stage"] = None
+            job["finished"] = datetime.now().isoformat()
+            if _inflight_jobs.get(job["bulletin_key"]) == job["job_id"]:
+                del _inflight_jobs[job["bulletin_key"]]
+
+            # Dimentica i job conclusi più vecchi
+            finished = [j for j in _jobs.values() if j["finished"]]
+            for old_job in sorted(finished, key=lambda j: j["finished"])[:-JOBS_MAX_FINISHED]:
+                del _jobs[old_job["job_id"]]
+
+    try:
+        _publish_job_event(job, status=result["status"], message=result["message"])
+        if result["status"] == "success":
+            # Tutte le pagine aperte sulla regione aggiornano le mappe cambiate
+            events.publish(job["region"], "published", {key: result.get(key) for key in
+                                                        ("region", "generation", "maps", "changes", "message")})
+    except Exception as e:
+        print(f"Impossibile notificare la conclusione del job {job['job_id']}: {e}")
+
+def submit_bulletin_job(region_id, profile=False):
+    """
+    Accoda l'elaborazione del bollettino della regione e restituisce il job. Se lo
+    stesso bollettino (stesso contenuto del PDF) è già in coda o in elaborazione,
+    restituisce il job esistente invece di avviarne un duplicato.
+    Con `profile` viene sempre avviato un nuovo job, profilato con cProfile
+    (in PROFILES_DIR/<job_id>.prof).
+    """
+    region = get_region(region_id)
+    pdf_path = region["pdf"]
+    if os.path.exists(pdf_path):
+        bulletin_key = (region_id, _file_sha256(pdf_path))
+    else:
+        bulletin_key = (region_id, os.path.abspath(pdf_path))
+
+    with _jobs_lock:
+        inflight_id = _inflight_jobs.get(bulletin_key)
+        if inflight_id is not None and not profile:
+            return _jobs[inflight_id]
+
+        job_id = uuid.uuid4().hex
+        job = {
+            "job_id": job_id,
+            "region": region_id,
+            "bulletin_key": bulletin_key,
+            "state": "queued",
+            "stage": None,
+            "created": datetime.now().isoformat(),
+            "started": None,
+            "finished": None,
+            "result": None,
+            "profile": f"{job_id}.prof" if profile else None,
+        }
+        _jobs[job["job_id"]] = job
+        _inflight_jobs[bulletin_key] = job["job_id"]
+        # Pubblicato sotto il lock: il job non può iniziare prima di risultare in coda
+        _publish_job_event(job)
+        if _region_running.get(region_id, 0) < JOB_REGION_WORKERS:
+            _region_running[region_id] = _region_running.get(region_id, 0) + 1
+        else:
+            _region_waiting.setdefault(region_id, deque()).append((job, region))
+            return job
+
+    _job_pool().submit(_run_region_job, job, region)
+    return job
+
+def _job_pool():
+    global _job_executor
+    with _jobs_lock:
+        if _job_executor is None:
+            _job_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='bulletin-job')
+        return _job_executor
+
+def _run_region_job(job, region):
+    """
+    Esegue il job e affida al pool il successivo in attesa della stessa regione,
+    in fondo alla coda: i job delle altre regioni già in coda passano prima.
+    """
+    try:
+        _run_job(job, region)
+    finally:
+        region_id = job["region"]
+        with _jobs_lock:
+            waiting = _region_waiting.get(region_id)
+            next_job = waiting.popleft() if waiting else None
+            if waiting is not None and not waiting:
+                del _region_waiting[region_id]
+            if next_job is None:
+                _region_running[region_id] -= 1
+                if not _region_running[region_id]:
+                    del _region_running[region_id]
+        if next_job is not None:
+            _job_pool().submit(_run_region_job, *next_job)
+
+def start_event_server():
+    """
+    Avvia il server SSE degli eventi (se EVENTS_PORT non è 0) nel processo che
+    esegue i job, dove gli eventi vengono pubblicati. Le chiamate successive non
+    fanno nulla, anche se il primo avvio non è riuscito (es. porta occupata).
+    """
+    global _event_server_started
+    if _event_server_started:
+        return
+    with _event_server_lock:
+        if _event_server_started or not EVENTS_PORT:
+            return
+        _event_server_started = True
+        events.start_server(EVENTS_HOST, EVENTS_PORT, _event_region)
+
+@app.before_request
+def _start_event_server_on_first_request():
+    # Qualunque sia il server (sviluppo, gunicorn, uWSGI...) solo il processo che
+    # serve le richieste arriva qui: con il reloader di debug non il processo padre
+    start_event_server()
+
+def _event_region(region_id):
+    region_id = region_id or default_region_id()
+    return region_id if get_region(region_id) is not None else None
+
+def events_url():
+    """
+    Indirizzo del flusso SSE per la pagina, o None se il server degli eventi non è attivo.
+    """
+    if EVENTS_URL:
+        return EVENTS_URL
+    if not EVENTS_PORT or not events.is_running() or _is_loopback(EVENTS_HOST):
+        # In ascolto solo in locale: un browser su un'altra macchina non lo raggiungerebbe
+        return None
+    # Stesso host della pagina, porta del server degli eventi
+    hostname = urlsplit(request.host_url).hostname
+    if ':' in hostname:
+        hostname = f"[{hostname}]"  # IPv6
+    return f"{request.scheme}://{hostname}:{EVENTS_PORT}/events"
+
+def _is_loopback(host):
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+# --- Pre-riscaldamento ---
+
+def _load_heavy_modules():
+    import numpy, pandas, shapely, geopandas, folium, topology  # noqa: F401
+    from PyPDF2 import PdfReader  # noqa: F401
+    _shared_geometry_layers_template()
+
+def prewarm(region_ids=None, render_pool=True):
+    """
+    Paga subito i costi di avvio che altrimenti ricadrebbero sulla prima
+    elaborazione: carica le librerie pesanti e la geometria dei comuni delle
+    regioni indicate (tutte se None) e, con `render_pool`, avvia i worker del
+    pool di rendering caricandovi le stesse librerie. Pensata per i processi di
+    lunga durata (server web, worker); le esecuzioni singole possono farne a meno.
+    """
+    start = time.perf_counter()
+    executor = get_render_executor() if render_pool else None
+    # I worker si avviano in parallelo con il caricamento nel processo corrente
+    futures = [executor.submit(_load_heavy_modules) for _ in range(RENDER_WORKERS)] if executor else []
+    _load_heavy_modules()
+    for region_id in (region_ids or load_regions()):
+        region = get_region(region_id)
+        if region is not None and os.path.exists(region["geojson"]):
+            load_municipalities(region["geojson"])
+    for future in futures:
+        future.result()
+    print(f"Pre-riscaldamento completato in {time.perf_counter() - start:.1f} s.")
+
+# --- Ricerca della criticità per coordinate ---
+
+API_MAX_BATCH_POINTS = 10000
+CRITICITY_DAYS = ("oggi", "domani")
+
+def _build_spatial_index(geojson_path):
+    import shapely
+
+    gdf = load_municipalities(geojson_path)
+    geometries = gdf.geometry.to_numpy()
+    shapely.prepare(geometries)
+    return {
+        "tree": shapely.STRtree(geometries),
+        "names": gdf['name'].tolist(),
+        "provinces": gdf['prov_acr'].tolist() if 'prov_acr' in gdf else [None] * len(gdf),
+        "nbytes": _PREPARED_COORDINATE_BYTES * int(shapely.get_num_coordinates(geometries).sum()),
+    }
+
+def _municipalities_spatial_index(geojson_path):
+    """
+    STRtree sui poligoni (preparati) dei comuni, ricostruito solo quando cambia la geometria.
+    """
+    version = municipalities_sha256(geojson_path)
+    return _region_cache.get_or_create(("spatial_index", version),
+                                       lambda: _build_spatial_index(geojson_path), lambda index: index["nbytes"])
+
+def _published_criticity_lookup(maps_dir, geojson_path):
+    """
+    Livello di ciascun comune per oggi e domani secondo il bollettino pubblicato,
+    ricalcolato solo quando cambia la generazione pubblicata. None se non ce n'è.
+    """
+    pointer = os.path.join(maps_dir, CURRENT_MAPS_POINTER)
+    try:
+        version = (os.stat(pointer).st_mtime_ns, municipalities_sha256(geojson_path))
+    except FileNotFoundError:
+        return None
+    key = ("published", os.path.abspath(maps_dir))
+    cached = _region_cache.get(key)
+    if cached is not None and cached["version"] == version:
+        return cached["lookup"]
+
+    with _region_cache.key_lock(key):
+        cached = _region_cache.get(key)
+        if cached is not None and cached["version"] == version:
+            return cached["lookup"]
+        bulletin = (read_published_maps(maps_dir) or {}).get("bulletin")
+        lookup = None
+        if bulletin:
+            mapping = bulletin["comune_to_bases_mapping"]
+            names = load_municipalities(geojson_path)['name']
+            levels = compute_municipalities_criticity(
+                names, {"oggi": bulletin["today"], "domani": bulletin["tomorrow"]}, mapping)
+            lookup = {
+                "bases": [mapping.get(name, []) for name in names],
+                "levels": {day: levels[day].tolist() for day in CRITICITY_DAYS},
+                "dates": {"oggi": bulletin["today_date"], "domani": bulletin["tomorrow_date"]},
+            }
+        nbytes = _LOOKUP_COMUNE_BYTES * len(lookup["bases"]) if lookup else 0
+        _region_cache.put(key, {"version": version, "lookup": lookup}, nbytes)
+        return lookup
+
+def lookup_criticity(lats, lons, days, maps_dir, geojson_path):
+    """
+    Restituisce, per ogni punto (lat, lon), il comune che lo contiene, le sue basi
+    di allerta e il livello di criticità per ciascuno dei `days` ("oggi", "domani")
+    secondo il bollettino pubblicato. I punti fuori da ogni comune hanno comune None.
+    Restituisce None se nessun bollettino è stato ancora pubblicato.
+    """
+    import numpy as np
+    import shapely
+
+    lookup = _published_criticity_lookup(maps_dir, geojson_path)
+    if lookup is None:
+        return None
+    index = _municipalities_spatial_index(geojson_path)
+
+    points = shapely.points(np.asarray(lons, dtype=float), np.asarray(lats, dtype=float))
+    point_idx, comune_idx = index["tree"].query(points, predicate='intersects')
+    # Punto sul confine tra due comuni: vale il primo trovato
+    matches = np.full(len(points), -1)
+    matches[point_idx[::-1]] = comune_idx[::-1]
+
+    results = []
+    for lat, lon, match in zip(lats, lons, matches.tolist()):
+        result = {"lat": lat, "lon": lon, "comune": None, "prov": None, "bases": [], "criticity": None}
+        if match >= 0:
+            result.update(comune=index["names"][match], prov=index["provinces"][match],
+                          bases=lookup["bases"][match], criticity={})
+            for day in days:
+                level = lookup["levels"][day][match]
+                result["criticity"][day] = {"date": lookup["dates"][day], "level": level,
+                                            "color": CRITICITY_COLORS_BY_LEVEL[level]}
+        results.append(result)
+    return results
+
+def _parse_days(value):
+    if not value:
+        return CRITICITY_DAYS
+    days = tuple(day.strip().lower() for day in value.split(','))
+    if not set(days) <= set(CRITICITY_DAYS):
+        raise ValueError(f"Giorno non valido: {value}. Valori ammessi: {', '.join(CRITICITY_DAYS)}.")
+    return days
+
+def _parse_coordinate(value, name, limit):
+    coordinate = float(value)
+    if not -limit <= coordinate <= limit:
+        raise ValueError(f"{name} fuori intervallo: {value}")
+    return coordinate
+
+# --- Tile vettoriali (Mapbox Vector Tile) ---
+
+# Tile generate su richiesta e salvate per generazione pubblicata: pubblicare un nuovo
+# bollettino invalida quelle della generazione sostituita (vedi _invalidate_tile_cache)
+TILES_CACHE_DIR = os.path.join(app.root_path, 'cache', 'tiles')
+TILE_EXTENT = 4096
+TILE_BUFFER = 64      # Margine (in unità della tile) per evitare artefatti ai bordi
+TILE_MAX_ZOOM = 18
+TILE_LAYER_NAME = 'municipalities'
+WEB_MERCATOR_HALF_SIZE = 20037508.342789244
+
+def _tile_bounds(z, x, y):
+    size = 2 * WEB_MERCATOR_HALF_SIZE / (1 << z)
+    minx = -WEB_MERCATOR_HALF_SIZE + x * size
+    maxy = WEB_MERCATOR_HALF_SIZE - y * size
+    return minx, maxy - size, minx + size, maxy
+
+def _tile_geometry(geojson_path, z):
+    """
+    Geometrie dei comuni in Web Mercator, semplificate per lo zoom della tile,
+    con il relativo STRtree; calcolate una volta per livello di dettaglio.
+    """
+    import shapely
+
+    version = municipalities_sha256(geojson_path)
+    max_zoom = next(max_zoom for max_zoom, _ in GEOMETRY_LEVELS if max_zoom is None or z <= max_zoom)
+
+    def build():
+        gdf = municipalities_for_zoom(load_municipalities(geojson_path), version, z).to_crs(epsg=3857)
+        geometries = gdf.geometry.to_numpy()
+        return {"geometries": geometries, "tree": shapely.STRtree(geometries), "names": gdf['name'].tolist()}
+
+    return _region_cache.get_or_create(
+        ("tiles", version, max_zoom), build,
+        lambda tile: _COORDINATE_BYTES * int(shapely.get_num_coordinates(tile["geometries"]).sum()))
+
+def build_vector_tile(geojson_path, maps_dir, day, z, x, y):
+    """
+    Codifica la tile z/x/y con i comuni che la intersecano, ciascuno con nome,
+    criticity_level_color e criticity_level_numeric del giorno indicato.
+    Restituisce None se nessun bollettino è stato ancora pubblicato.
+    """
+    import shapely
+
+    import mapbox_vector_tile  # Dipendenza usata solo da questo endpoint
+
+    lookup = _published_criticity_lookup(maps_dir, geojson_path)
+    if lookup is None:
+        return None
+    tile = _tile_geometry(geojson_path, z)
+
+    minx, miny, maxx, maxy = _tile_bounds(z, x, y)
+    margin = (maxx - minx) * TILE_BUFFER / TILE_EXTENT
+    clip_box = (minx - margin, miny - margin, maxx + margin, maxy + margin)
+
+    features = []
+    for index in sorted(tile["tree"].query(shapely.box(*clip_box)).tolist()):
+        geometry = shapely.clip_by_rect(tile["geometries"][index], *clip_box)
+        if geometry.is_empty:
+            continue
+        level = lookup["levels"][day][index]
+        features.append({
+            "id": index,
+            "geometry": geometry,
+            "properties": {
+                "name": tile["names"][index],
+                "criticity_level_color": CRITICITY_COLORS_BY_LEVEL[level],
+                "criticity_level_numeric": level,
+            },
+        })
+
+    return mapbox_vector_tile.encode(
+        {"name": TILE_LAYER_NAME, "features": features},
+        default_options={"quantize_bounds": (minx, miny, maxx, maxy), "extents": TILE_EXTENT,
+                         "on_invalid_geometry": mapbox_vector_tile.encoder.on_invalid_geometry_make_valid},
+    )
+
+def _invalidate_tile_cache(replaced_generation):
+    # Le tile delle altre regioni (altre generazioni pubblicate) restano valide
+    shutil.rmtree(os.path.join(TILES_CACHE_DIR, replaced_generation), ignore_errors=True)
+
+def cached_vector_tile_path(geojson_path, maps_dir, day, z, x, y):
+    """
+    Percorso della tile nella cache della generazione pubblicata, generandola se
+    manca. Restituisce None se nessun bollettino è stato ancora pubblicato.
+    """
+    published = read_published_maps(maps_dir)
+    if not published:
+        return None
+    tile_path = os.path.join(TILES_CACHE_DIR, published["generation"], day, str(z), str(x), f"{y}.mvt")
+    if os.path.exists(tile_path):
+        CACHE_REQUESTS.inc(cache="tiles", result="hit")
+    else:
+        CACHE_REQUESTS.inc(cache="tiles", result="miss")
+        with STAGE_SECONDS.time(stage="tile_build"):
+            data = build_vector_tile(geojson_path, maps_dir, day, z, x, y)
+        if data is None:
+            return None
+        OUTPUT_BYTES.observe(len(data), kind="vector_tile")
+        os.makedirs(os.path.dirname(tile_path), exist_ok=True)
+        tmp_path = f"{tile_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, tile_path)
+        # Se nel frattempo è stata pubblicata un'altra generazione, la directory di
+        # questa è già stata invalidata: la tile non deve restarvi orfana
+        current = read_published_maps(maps_dir)
+        if not current or current["generation"] != published["generation"]:
+            _invalidate_tile_cache(published["generation"])
+            return cached_vector_tile_path(geojson_path, maps_dir, day, z, x, y)
+    return tile_path
+
+def _request_region_id():
+    """
+    Regione richiesta: parametro ?region= o campo "region" del JSON, altrimenti
+    quella predefinita.
+    """
+    payload = request.get_json(silent=True) if request.is_json else None
+    return request.args.get('region') or (payload or {}).get('region') or default_region_id()
+
+def _unknown_region(region_id):
+    return jsonify({"status": "error", "message": f"Regione non configurata: {region_id}"}), 404
+
+@app.route('/')
+def index():
+    """
+    Pagina principale del portale.
+    """
+    region_id = _request_region_id()
+    region = get_region(region_id)
+    if region is None:
+        return _unknown_region(region_id)
+    manifest = read_published_maps(region_maps_dir(region_id))
+    generated_maps = manifest["maps"] if manifest else []
+    return render_template('index.html', generated_maps=generated_maps, region_id=region_id,
+                           region=region, regions=load_regions(), events_url=events_url(),
+                           last_event_id=events.last_event_id(region_id))
+
+@app.route('/process_bulletin', methods=['POST'])
+def process_bulletin():
+    """
+    Endpoint per avviare il processo di lettura e generazione mappe.
+    L'elaborazione avviene in background: la risposta contiene l'id del job
+    da interrogare su /jobs/<job_id>. La regione si indica con ?region= o nel
+    JSON ({"region": ...}); con ?profile=1 il job viene profilato.
+    """
+    region_id = _request_region_id()
+    if get_region(region_id) is None:
+        return _unknown_region(region_id)
+    profile = request.args.get('profile') == '1'
+    if profile and not PROFILES_DIR:
+        return jsonify({"status": "error", "message": "Profilazione non abilitata (BOLLETTINO_PROFILE_DIR non impostata)."}), 400
+    job = submit_bulletin_job(region_id, profile=profile)
+    with _jobs_lock:
+        body = _job_public_view(job)
+    body["status"] = "accepted"
+    body["status_url"] = url_for('job_status', job_id=job["job_id"])
+    return jsonify(body), 202
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """
+    Stato di un job di elaborazione e, a job concluso, il suo risultato.
+    """
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return jsonify({"status": "error", "message": f"Job {job_id} non trovato."}), 404
+        return jsonify(_job_public_view(job))
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """
+    Metriche dell'elaborazione (durate delle fasi, byte generati, cache) in
+    formato Prometheus.
+    """
+    return app.response_class(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/criticity', methods=['GET', 'POST'])
+def api_criticity():
+    """
+    Criticità in un punto: GET ?lat=&lon=[&day=oggi|domani][&region=]. In POST
+    accetta un JSON {"points": [[lat, lon], ...], "day": ..., "region": ...} per
+    interrogare molti punti insieme.
+    """
+    region_id = _request_region_id()
+    region = get_region(region_id)
+    if region is None:
+        return _unknown_region(region_id)
+    try:
+        if request.method == 'POST':
+            payload = request.get_json(silent=True) or {}
+            raw_points = payload.get("points") or []
+            if len(raw_points) > API_MAX_BATCH_POINTS:
+                raise ValueError(f"Troppi punti: massimo {API_MAX_BATCH_POINTS} per richiesta.")
+            points = [(point["lat"], point["lon"]) if isinstance(point, dict) else point for point in raw_points]
+            days = _parse_days(payload.get("day"))
+        else:
+            points = [(request.args.get('lat'), request.args.get('lon'))]
+            days = _parse_days(request.args.get('day'))
+        lats = [_parse_coordinate(lat, "Latitudine", 90) for lat, _ in points]
+        lons = [_parse_coordinate(lon, "Longitudine", 180) for _, lon in points]
+    except (TypeError, ValueError, KeyError) as e:
+        return jsonify({"status": "error", "message": f"Richiesta non valida: {e}"}), 400
+
+    results = lookup_criticity(lats, lons, days, region_maps_dir(region_id), region["geojson"])
+    if results is None:
+        return jsonify({"status": "error", "message": "Nessun bollettino pubblicato: elabora prima un bollettino."}), 503
+
+    if request.method == 'POST':
+        return jsonify({"status": "success", "results": results})
+    return jsonify(dict(results[0], status="success"))
+
+@app.route('/api/changes')
+def api_changes():
+    """
+    Modifiche del bollettino pubblicato della regione (?region=) rispetto al
+    precedente: basi e comuni che hanno cambiato livello e mappe rigenerate.
+    "changes" è null per il primo bollettino o dopo un cambio di geometria.
+    """
+    region_id = _request_region_id()
+    if get_region(region_id) is None:
+        return _unknown_region(region_id)
+    manifest = read_published_maps(region_maps_dir(region_id))
+    if manifest is None:
+        return jsonify({"status": "error", "message": "Nessun bollettino pubblicato: elabora prima un bollettino."}), 503
+    return jsonify({"status": "success", "generation": manifest["generation"], "changes": manifest.get("changes")})
+
+@app.route('/tiles/<day>/<int:z>/<int:x>/<int:y>.mvt')
+def serve_tile(day, z, x, y):
+    """
+    Tile vettoriale (Mapbox Vector Tile) dei comuni con la criticità del giorno
+    ("oggi" o "domani") secondo il bollettino pubblicato della regione (?region=).
+    """
+    region_id = _request_region_id()
+    region = get_region(region_id)
+    if region is None:
+        return _unknown_region(region_id)
+    if day not in CRITICITY_DAYS or not 0 <= z <= TILE_MAX_ZOOM or not (0 <= x < (1 << z) and 0 <= y < (1 << z)):
+        return jsonify({"status": "error", "message": "Tile non valida."}), 404
+    if not os.path.exists(region["geojson"]):
+        return jsonify({"status": "error", "message": f"File GeoJSON dei comuni non trovato: {region['geojson']}"}), 500
+
+    tile_path = cached_vector_tile_path(region["geojson"], region_maps_dir(region_id), day, z, x, y)
+    if tile_path is None:
+        return jsonify({"status": "error", "message": "Nessun bollettino pubblicato: elabora prima un bollettino."}), 503
+    response = send_file(tile_path, mimetype='application/vnd.mapbox-vector-tile')
+    response.cache_control.no_cache = True  # Cambia a ogni nuovo bollettino: rivalida con l'ETag
+    return response
+
+@functools.lru_cache(maxsize=4096)
+def _content_etag(path, mtime_ns, size):
+    # I file serviti non vengono mai riscritti sul posto: basta un hash per versione del file
+    return _file_sha256(path)[:32]
+
+def send_precompressed(directory, filename, max_age=None, immutable=False):
+    """
+    Serve `filename` da `directory` scegliendo in base all'Accept-Encoding la
+    variante precompressa (br, gzip) o l'originale. L'ETag forte è l'hash del
+    contenuto (con la codifica, perché ogni variante ha byte diversi) e le
+    richieste di rivalidazione con If-None-Match ricevono 304.
+    Senza `max_age` il client deve rivalidare a ogni uso (no-cache).
+    """
+    path = safe_join(directory, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    stat = os.stat(path)
+    etag = _content_etag(path, stat.st_mtime_ns, stat.st_size)
+
+    send_path, encoding = path, None
+    candidates = [(request.accept_encodings[name], -position, name, suffix)
+                  for position, (name, suffix) in enumerate(PRECOMPRESSED_ENCODINGS)]
+    for quality, _, name, suffix in sorted(candidates, reverse=True):
+        if quality > 0 and os.path.exists(path + suffix):
+            send_path, encoding = path + suffix, name
+            etag = f"{etag}-{name}"
+            break
+
+    if filename.endswith(('.topojson', '.geojson')):
+        mimetype = 'application/json'
+    else:
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    # Il nome è quello della risorsa decodificata, non della variante compressa
+    response = send_file(send_path, mimetype=mimetype, etag=etag, conditional=True, max_age=max_age,
+                         download_name=os.path.basename(path))
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    if max_age:
+        response.cache_control.public = True
+        response.cache_control.immutable = immutable
+    return response
+
+# I file di una generazione non cambiano mai dopo la pubblicazione (una nuova
+# elaborazione crea una nuova generazione, con un nuovo URL)
+MAPS_MAX_AGE = 365 * 24 * 3600
+_MUTABLE_MAP_FILES = (CURRENT_MAPS_POINTER, 'manifest.json')
+
+@app.route('/static/maps/<path:filename>')
+def serve_map(filename):
+    """
+    Serve i file HTML delle mappe generate, precompressi e con ETag.
+    """
+    if os.path.basename(filename) in _MUTABLE_MAP_FILES:
+        return send_precompressed(STATIC_MAPS_DIR, filename)
+    return send_precompressed(STATIC_MAPS_DIR, filename, max_age=MAPS_MAX_AGE, immutable=True)
+
+@app.route('/geometry/<path:filename>')
+def serve_geometry(filename):
+    """
+    Serve la geometria condivisa dalle mappe. Il nome file contiene la versione
+    della geometria, quindi il browser può tenerla in cache senza rivalidarla.
+    """
+    return send_precompressed(GEOMETRY_ASSETS_DIR, filename, max_age=GEOMETRY_ASSETS_MAX_AGE, immutable=True)
+
+if __name__ == '__main__':
+    # Carica librerie e geometria della regione predefinita all'avvio, così la prima
+    # richiesta trova la cache già calda (le altre regioni vengono caricate al primo uso)
+    prewarm([default_region_id()], render_pool=False)
+    app.run(debug=True)
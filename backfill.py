@@ -0,0 +1,193 @@
+"""
+Importazione in blocco di un archivio di bollettini PDF in un database SQLite.
+
+Per ogni bollettino vengono estratte le criticità di oggi e domani e la mappatura
+Comune-Basi, e viene scritta una riga per ciascuna combinazione (giorno, comune, base).
+I file già importati (riconosciuti dallo SHA-256) vengono saltati, quindi
+l'importazione può essere interrotta e ripresa.
+
+Uso:
+    python backfill.py archivio_bollettini/ --db criticita.sqlite [--workers 8]
+"""
+import argparse
+import os
+import re
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from app import (
+    CRITICITY_COLORS_BY_LEVEL,
+    CRITICITY_LEVELS,
+    _file_sha256,
+    compute_municipalities_criticity,
+    extract_bulletin,
+)
+
+DEFAULT_DB_PATH = 'criticita_storico.sqlite'
+
+# Data nel nome file, es. "Bollettino_Criticita_Regione_Basilicata_28_05_2025.pdf"
+_FILENAME_DATE_RE = re.compile(r"(\d{1,2})_(\d{1,2})_(\d{4})\.pdf$", re.IGNORECASE)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bulletins (
+    sha256 TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    today_date TEXT,
+    tomorrow_date TEXT,
+    ingested_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS criticity (
+    bulletin_sha256 TEXT NOT NULL REFERENCES bulletins(sha256),
+    date TEXT NOT NULL,            -- giorno a cui si riferisce la criticità (aaaa-mm-gg)
+    horizon TEXT NOT NULL,         -- 'oggi' o 'domani' rispetto all'emissione del bollettino
+    comune TEXT NOT NULL,
+    base TEXT NOT NULL,
+    base_level INTEGER NOT NULL,
+    base_color TEXT NOT NULL,
+    comune_level INTEGER NOT NULL, -- massima gravosità tra tutte le basi del comune
+    comune_color TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_criticity_date_comune ON criticity (date, comune);
+CREATE INDEX IF NOT EXISTS idx_criticity_comune_date ON criticity (comune, date);
+"""
+
+def _parse_date(value):
+    return datetime.strptime(value, '%d/%m/%Y').date() if value else None
+
+def _bulletin_dates(bulletin, pdf_path):
+    """
+    Date (oggi, domani) del bollettino: quelle nel testo, altrimenti quella nel nome file.
+    """
+    today = _parse_date(bulletin["today_date"])
+    tomorrow = _parse_date(bulletin["tomorrow_date"])
+    if today is None and tomorrow is not None:
+        today = tomorrow - timedelta(days=1)
+    if today is None:
+        match = _FILENAME_DATE_RE.search(os.path.basename(pdf_path))
+        if match is None:
+            return None, None
+        day, month, year = (int(part) for part in match.groups())
+        today = datetime(year, month, day).date()
+    return today, tomorrow or today + timedelta(days=1)
+
+def process_bulletin_file(pdf_path):
+    """
+    Elabora un singolo bollettino (eseguita nei processi worker) e restituisce
+    le informazioni del bollettino e le righe (giorno, comune, base) da inserire.
+    """
+    bulletin = extract_bulletin(pdf_path)
+    mapping = bulletin["comune_to_bases_mapping"]
+    if not mapping or not (bulletin["today"] or bulletin["tomorrow"]):
+        raise ValueError("tabelle di criticità o mappatura Comune-Basi non trovate")
+    today, tomorrow = _bulletin_dates(bulletin, pdf_path)
+    if today is None:
+        raise ValueError("data del bollettino non trovata")
+
+    days = {"oggi": bulletin["today"], "domani": bulletin["tomorrow"]}
+    comuni = list(mapping)
+    comune_levels = compute_municipalities_criticity(comuni, days, mapping)
+    comune_levels.index = comuni
+
+    comune_bases = pd.Series(mapping, dtype=object).explode().dropna()
+    verde = CRITICITY_LEVELS["VERDE"]
+    frames = []
+    for horizon, date in (("oggi", today), ("domani", tomorrow)):
+        if not days[horizon]:
+            continue
+        base_levels = pd.Series(days[horizon], dtype=object).str.upper().map(CRITICITY_LEVELS)
+        frame = pd.DataFrame({
+            'date': date.isoformat(),
+            'horizon': horizon,
+            'comune': comune_bases.index,
+            'base': comune_bases.to_numpy(),
+        })
+        frame['base_level'] = frame['base'].map(base_levels).fillna(verde).clip(lower=verde).astype(int)
+        frame['comune_level'] = frame['comune'].map(comune_levels[horizon]).astype(int)
+        frames.append(frame)
+
+    rows = pd.concat(frames, ignore_index=True)
+    rows['base_color'] = rows['base_level'].map(CRITICITY_COLORS_BY_LEVEL)
+    rows['comune_color'] = rows['comune_level'].map(CRITICITY_COLORS_BY_LEVEL)
+    columns = ['date', 'horizon', 'comune', 'base', 'base_level', 'base_color', 'comune_level', 'comune_color']
+    return {
+        "today_date": today.isoformat(),
+        "tomorrow_date": tomorrow.isoformat(),
+        "rows": list(rows[columns].itertuples(index=False, name=None)),
+    }
+
+def _find_pdfs(pdf_dir):
+    for root, _, files in os.walk(pdf_dir):
+        for f in sorted(files):
+            if f.lower().endswith('.pdf'):
+                yield os.path.join(root, f)
+
+def backfill_archive(pdf_dir, db_path=DEFAULT_DB_PATH, workers=None):
+    """
+    Importa tutti i PDF sotto `pdf_dir` in `db_path` usando un pool di processi
+    (di default uno per core). Restituisce un riepilogo con i conteggi dei file
+    importati, saltati perché già presenti e falliti.
+    """
+    connection = sqlite3.connect(db_path)
+    connection.executescript(SCHEMA)
+    ingested = {row[0] for row in connection.execute("SELECT sha256 FROM bulletins")}
+
+    pending = {}
+    skipped = 0
+    for pdf_path in _find_pdfs(pdf_dir):
+        sha256 = _file_sha256(pdf_path)
+        if sha256 in ingested or sha256 in pending.values():
+            skipped += 1
+        else:
+            pending[pdf_path] = sha256
+    print(f"{len(pending)} bollettini da importare, {skipped} già presenti.")
+
+    summary = {"ingested": 0, "skipped": skipped, "failed": []}
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(process_bulletin_file, path): path for path in pending}
+        for future in as_completed(futures):
+            pdf_path = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"Errore durante l'importazione di {pdf_path}: {e}")
+                summary["failed"].append(pdf_path)
+                continue
+
+            sha256 = pending[pdf_path]
+            # Righe e bollettino nella stessa transazione: un'interruzione non lascia
+            # file importati a metà, che verrebbero saltati alla ripresa
+            with connection:
+                connection.executemany(
+                    "INSERT INTO criticity (bulletin_sha256, date, horizon, comune, base, base_level, "
+                    "base_color, comune_level, comune_color) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(sha256, *row) for row in result["rows"]],
+                )
+                connection.execute(
+                    "INSERT INTO bulletins (sha256, filename, today_date, tomorrow_date, ingested_at) VALUES (?, ?, ?, ?, ?)",
+                    (sha256, os.path.relpath(pdf_path, pdf_dir), result["today_date"],
+                     result["tomorrow_date"], datetime.now().isoformat()),
+                )
+            summary["ingested"] += 1
+
+    connection.close()
+    print(f"Importati {summary['ingested']} bollettini in {time.perf_counter() - start:.1f} s "
+          f"({len(summary['failed'])} errori).")
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Importa un archivio di bollettini PDF in SQLite.")
+    parser.add_argument('pdf_dir', help="Directory (anche con sottodirectory) contenente i PDF")
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help=f"Database SQLite di destinazione (default: {DEFAULT_DB_PATH})")
+    parser.add_argument('--workers', type=int, default=None, help="Numero di processi (default: numero di core)")
+    args = parser.parse_args()
+
+    summary = backfill_archive(args.pdf_dir, args.db, args.workers)
+    return 1 if summary["failed"] else 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
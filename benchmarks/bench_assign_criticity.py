@@ -0,0 +1,113 @@
+"""
+Confronto tra l'assegnazione della criticità con il vecchio ciclo iterrows()
+e la versione colonnare di app.compute_municipalities_criticity.
+
+Uso (dalla radice del repository):
+    python benchmarks/bench_assign_criticity.py --comuni 8000 --giorni 2
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import geopandas as gpd
+from shapely.geometry import Point
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import (  # noqa: E402
+    assign_municipalities_criticity,
+    compute_municipalities_criticity,
+    get_criticity_level_numeric,
+)
+
+BASES = ["A1", "A2", "B", "C", "D", "E1", "E2"]
+COLORS = ["VERDE", "VERDE", "VERDE", "GIALLO", "ARANCIONE", "ROSSO"]
+
+def legacy_assign_municipalities_criticity(gdf_municipalities, bases_criticity_data, comune_to_bases_mapping):
+    """
+    Implementazione originale con iterrows(), mantenuta solo come riferimento.
+    """
+    gdf_municipalities['criticity_level_color'] = "VERDE"
+    gdf_municipalities['criticity_level_numeric'] = get_criticity_level_numeric("VERDE")
+
+    for index, row in gdf_municipalities.iterrows():
+        applicable_bases = comune_to_bases_mapping.get(row['name'], [])
+        max_criticity_numeric = get_criticity_level_numeric("VERDE")
+        final_criticity_color = "VERDE"
+        for base_key in applicable_bases:
+            base_color = bases_criticity_data.get(base_key, "VERDE")
+            current_criticity_numeric = get_criticity_level_numeric(base_color)
+            if current_criticity_numeric > max_criticity_numeric:
+                max_criticity_numeric = current_criticity_numeric
+                final_criticity_color = base_color
+        gdf_municipalities.at[index, 'criticity_level_color'] = final_criticity_color
+        gdf_municipalities.at[index, 'criticity_level_numeric'] = max_criticity_numeric
+
+    return gdf_municipalities
+
+def make_dataset(n_comuni, n_days, seed=0):
+    """
+    Genera comuni sintetici (geometria puntuale), mappatura Comune-Basi e
+    criticità delle basi per `n_days` giorni.
+    """
+    rng = random.Random(seed)
+    names = [f"Comune {i:05d}" for i in range(n_comuni)]
+    gdf = gpd.GeoDataFrame(
+        {'name': names},
+        geometry=[Point(rng.uniform(6.6, 18.5), rng.uniform(36.6, 47.1)) for _ in names],
+        crs="EPSG:4326",
+    )
+    mapping = {name: rng.sample(BASES, rng.choice([1, 1, 1, 2])) for name in names}
+    days = {
+        f"giorno_{d}": {base: rng.choice(COLORS) for base in BASES}
+        for d in range(n_days)
+    }
+    return gdf, mapping, days
+
+def best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--comuni', type=int, default=8000)
+    parser.add_argument('--giorni', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    gdf, mapping, days = make_dataset(args.comuni, args.giorni)
+
+    def run_legacy():
+        for bases in days.values():
+            legacy_assign_municipalities_criticity(gdf.copy(), bases, mapping)
+
+    def run_vectorized():
+        for bases in days.values():
+            assign_municipalities_criticity(gdf.copy(), bases, mapping)
+
+    def run_multi_day():
+        compute_municipalities_criticity(gdf['name'], days, mapping)
+
+    # Verifica che le due implementazioni diano lo stesso risultato
+    for bases in days.values():
+        expected = legacy_assign_municipalities_criticity(gdf.copy(), bases, mapping)
+        actual = assign_municipalities_criticity(gdf.copy(), bases, mapping)
+        assert (expected['criticity_level_numeric'].to_numpy() == actual['criticity_level_numeric'].to_numpy()).all()
+
+    legacy = best_of(args.repeat, run_legacy)
+    vectorized = best_of(args.repeat, run_vectorized)
+    multi_day = best_of(args.repeat, run_multi_day)
+
+    print(f"{args.comuni} comuni, {args.giorni} giorni (migliore di {args.repeat})")
+    print(f"  iterrows (originale):          {legacy * 1000:9.1f} ms")
+    print(f"  colonnare, un giorno per volta: {vectorized * 1000:9.1f} ms  ({legacy / vectorized:.0f}x)")
+    print(f"  colonnare, tutti i giorni:      {multi_day * 1000:9.1f} ms  ({legacy / multi_day:.0f}x)")
+
+if __name__ == '__main__':
+    main()
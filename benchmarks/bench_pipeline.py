@@ -0,0 +1,234 @@
+"""
+Benchmark della pipeline del bollettino su dati sintetici a 1x, 10x e 60x la Basilicata.
+
+Misura separatamente ogni fase (estrazione dal PDF, caricamento della geometria,
+assegnazione della criticità, rendering delle mappe) e la richiesta completa
+/process_bulletin tramite il test client di Flask, con il picco di memoria di
+ciascuna. I risultati vengono scritti in JSON per il confronto tra commit.
+
+Uso (dalla radice del repository):
+    python benchmarks/bench_pipeline.py [--scales 1,10,60] [--repeat 3] [--output risultati.json]
+    python benchmarks/bench_pipeline.py --compare vecchio.json nuovo.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import app  # noqa: E402
+import synthetic  # noqa: E402
+
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+SOURCE_GEOJSON = os.path.join(REPO_DIR, 'limits_R_17_municipalities.geojson')
+JOB_TIMEOUT = 600
+
+def measure(func, repeat, setup=None):
+    """
+    Esegue `func` `repeat` volte (dopo `setup`, non misurato) e restituisce tempi
+    (minimo e mediana, in secondi) e picco di memoria Python allocata (tracemalloc).
+    I tempi si misurano con tracemalloc spento, che rallenta molto e in modo
+    disomogeneo il codice ricco di allocazioni; il picco di memoria viene
+    misurato in un'esecuzione aggiuntiva, non cronometrata.
+    """
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"min_s": min(timings), "median_s": statistics.median(timings), "peak_bytes": peak, "runs": repeat}
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _isolate_app(work_dir):
+    """
+    Reindirizza tutte le directory di output e di cache dell'app in `work_dir`.
+    """
+    app.STATIC_MAPS_DIR = os.path.join(work_dir, 'maps')
+    app.GEOMETRY_ASSETS_DIR = os.path.join(work_dir, 'geometry')
+    app.GEOMETRY_CACHE_DIR = os.path.join(work_dir, 'cache', 'geometry')
+    app.RESULTS_CACHE_DIR = os.path.join(work_dir, 'cache', 'results')
+    app.TILES_CACHE_DIR = os.path.join(work_dir, 'cache', 'tiles')
+    app.REGIONS_CONFIG_PATH = os.path.join(work_dir, 'regions.json')  # Solo la regione predefinita
+    os.makedirs(app.STATIC_MAPS_DIR, exist_ok=True)
+    os.makedirs(app.RESULTS_CACHE_DIR, exist_ok=True)
+
+def _discard_cached(kind):
+    return lambda: app._region_cache.discard(lambda key: key[0] == kind)
+
+def _clear_caches():
+    """
+    Riporta l'app allo stato di un primo avvio: oltre alle cache vengono rimosse
+    mappe pubblicate, asset della geometria e tile, così la richiesta a freddo
+    genera davvero le mappe e il TopoJSON.
+    """
+    app._region_cache.clear()
+    for directory in (app.STATIC_MAPS_DIR, app.GEOMETRY_ASSETS_DIR, app.GEOMETRY_CACHE_DIR,
+                      app.RESULTS_CACHE_DIR, app.TILES_CACHE_DIR):
+        shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(app.STATIC_MAPS_DIR, exist_ok=True)
+    os.makedirs(app.RESULTS_CACHE_DIR, exist_ok=True)
+
+def _process_bulletin_request(client):
+    response = client.post('/process_bulletin')
+    status_url = response.get_json()["status_url"]
+    deadline = time.monotonic() + JOB_TIMEOUT
+    while time.monotonic() < deadline:
+        job = client.get(status_url).get_json()
+        if job["state"] in ("done", "failed"):
+            if job["state"] != "done":
+                raise RuntimeError(f"Elaborazione fallita: {job['result']}")
+            return job["result"]
+        time.sleep(0.01)
+    raise TimeoutError("Elaborazione del bollettino oltre il timeout")
+
+def bench_scale(scale, repeat, work_dir):
+    """
+    Misura tutte le fasi della pipeline su un dataset `scale` volte la Basilicata.
+    """
+    _isolate_app(work_dir)
+    geojson_path = os.path.join(work_dir, 'municipalities.geojson')
+    pdf_path = os.path.join(work_dir, 'bollettino.pdf')
+
+    gdf = synthetic.scaled_municipalities(SOURCE_GEOJSON, scale)
+    gdf.to_file(geojson_path, driver='GeoJSON')
+    bulletin = synthetic.random_bulletin(zip(gdf['name'], gdf['prov_acr']), seed=scale)
+    synthetic.write_bulletin_pdf(bulletin, pdf_path)
+
+    stages = {}
+    stages["pdf_extract"] = measure(lambda: app.extract_data_from_pdf(pdf_path), repeat)
+    today, tomorrow, mapping = app.extract_data_from_pdf(pdf_path)
+
+    stages["geometry_load_cold"] = measure(lambda: app.load_municipalities(geojson_path), repeat, setup=_clear_caches)
+    stages["geometry_load_binary"] = measure(lambda: app.load_municipalities(geojson_path), repeat,
+                                             setup=_discard_cached("municipalities"))
+    stages["geometry_load_warm"] = measure(lambda: app.load_municipalities(geojson_path), repeat)
+    municipalities = app.load_municipalities(geojson_path)
+    version = app.municipalities_sha256(geojson_path)
+
+    def assign_criticity():
+        # Come nella pipeline: un solo calcolo colonnare per entrambi i giorni
+        day_levels = app.compute_municipalities_criticity(
+            municipalities['name'], {"oggi": today, "domani": tomorrow}, mapping)
+        return [app.set_criticity_columns(municipalities.copy(deep=False), day_levels[day])
+                for day in ("oggi", "domani")]
+
+    stages["criticity_assign"] = measure(assign_criticity, repeat)
+    assigned = assign_criticity()[1]
+
+    render_dir = os.path.join(work_dir, 'render')
+    os.makedirs(render_dir, exist_ok=True)
+    stages["geometry_levels"] = measure(lambda: app._simplified_levels(municipalities, version), repeat,
+                                        setup=_discard_cached("levels"))
+    stages["render_embedded_day"] = measure(
+        lambda: app.create_styled_map(assigned, "Benchmark", render_dir, "bench", geometry_version=version), repeat)
+    stages["render_shared_day"] = measure(
+        lambda: app.create_daily_map(assigned, "Benchmark", render_dir, "bench_day",
+                                     app.write_geometry_assets(municipalities, app.GEOMETRY_ASSETS_DIR, version)),
+        repeat)
+
+    app.BOLLETTINO_PDF_PATH = pdf_path
+    app.GEOJSON_MUNICIPALITIES_PATH = geojson_path
+    client = app.app.test_client()
+    stages["request_cold"] = measure(lambda: _process_bulletin_request(client), repeat, setup=_clear_caches)
+    stages["request_cached"] = measure(lambda: _process_bulletin_request(client), repeat)
+
+    return {
+        "scale": scale,
+        "comuni": len(gdf),
+        "pdf_bytes": os.path.getsize(pdf_path),
+        "geojson_bytes": os.path.getsize(geojson_path),
+        "stages": stages,
+    }
+
+def compare(old_path, new_path):
+    """
+    Stampa, per scala e fase, il rapporto tra i tempi minimi di due file di risultati.
+    """
+    with open(old_path) as f:
+        old = {run["scale"]: run for run in json.load(f)["runs"]}
+    with open(new_path) as f:
+        new = {run["scale"]: run for run in json.load(f)["runs"]}
+    for scale in sorted(old.keys() & new.keys()):
+        print(f"Scala {scale}x")
+        for stage, result in new[scale]["stages"].items():
+            before = old[scale]["stages"].get(stage)
+            if before is None:
+                continue
+            ratio = result["min_s"] / before["min_s"] if before["min_s"] else float('inf')
+            flag = "  <-- regressione" if ratio > 1.2 else ""
+            print(f"  {stage:24s} {before['min_s'] * 1000:10.1f} ms -> {result['min_s'] * 1000:10.1f} ms  ({ratio:.2f}x){flag}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scales', default='1,10,60', help="Scale da misurare, separate da virgola (default: 1,10,60)")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help="File JSON dei risultati (default: benchmarks/results/<data>-<commit>.json)")
+    parser.add_argument('--compare', nargs=2, metavar=('VECCHIO', 'NUOVO'), help="Confronta due file di risultati")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    commit = _git_commit()
+    report = {
+        "commit": commit,
+        "created": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "render_workers": app.RENDER_WORKERS,
+        "map_render_mode": app.MAP_RENDER_MODE,
+        "runs": [],
+    }
+    # Le librerie vengono caricate alla prima richiesta: il loro import non va
+    # attribuito alla prima fase misurata
+    app.prewarm(render_pool=False)
+    for scale in (int(s) for s in args.scales.split(',')):
+        with tempfile.TemporaryDirectory(prefix=f"bench_{scale}x_") as work_dir:
+            print(f"Scala {scale}x...", flush=True)
+            run = bench_scale(scale, args.repeat, work_dir)
+            report["runs"].append(run)
+            for stage, result in run["stages"].items():
+                print(f"  {stage:24s} {result['min_s'] * 1000:10.1f} ms  picco {result['peak_bytes'] / 2**20:8.1f} MiB")
+    # Picco di memoria residente dell'intero processo (kB su Linux)
+    report["max_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%dT%H%M%S}-{commit or 'nogit'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Risultati scritti in {output}")
+
+if __name__ == '__main__':
+    main()
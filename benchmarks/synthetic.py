@@ -0,0 +1,112 @@
+"""
+Dati sintetici per i benchmark: strato dei comuni e bollettini PDF a scala N volte
+la Basilicata, generati senza accesso alla rete e senza dipendenze aggiuntive.
+"""
+import random
+from datetime import date, timedelta
+
+import geopandas as gpd
+import pandas as pd
+from shapely import affinity
+
+BASES = ["A1", "A2", "B", "C", "D", "E1", "E2"]
+LEVELS = ["ASSENTE-VERDE"] * 4 + ["ORDINARIA - GIALLO", "MODERATA-ARANCIONE", "ELEVATA-ROSSO"]
+WEEKDAYS = ["LUNEDI'", "MARTEDI'", "MERCOLEDI'", "GIOVEDI'", "VENERDI'", "SABATO", "DOMENICA"]
+
+def scaled_municipalities(source_path, scale):
+    """
+    Replica lo strato dei comuni `scale` volte su una griglia di copie traslate
+    (stessa forma e stesso numero di vertici, confini condivisi compresi),
+    con nomi univoci.
+    """
+    source = gpd.read_file(source_path)[['name', 'prov_acr', 'geometry']]
+    if scale == 1:
+        return source
+    minx, miny, maxx, maxy = source.total_bounds
+    columns = max(1, round(scale ** 0.5))
+    copies = []
+    for copy_index in range(scale):
+        row, column = divmod(copy_index, columns)
+        copy = source.copy()
+        copy['name'] = copy['name'] + f" {copy_index}"
+        copy.geometry = copy.geometry.apply(
+            affinity.translate, xoff=column * (maxx - minx), yoff=row * (maxy - miny))
+        copies.append(copy)
+    return gpd.GeoDataFrame(pd.concat(copies, ignore_index=True), crs=source.crs)
+
+def random_bulletin(comuni, seed=0, issued=date(2025, 5, 28)):
+    """
+    Contenuto di un bollettino casuale: livelli per base di oggi e domani
+    (tre colonne ciascuno) e zona di allerta di ogni comune.
+    """
+    rng = random.Random(seed)
+    return {
+        "today_date": issued,
+        "today": {base: [rng.choice(LEVELS) for _ in range(3)] for base in BASES},
+        "tomorrow": {base: [rng.choice(LEVELS) for _ in range(3)] for base in BASES},
+        "comuni": [(name, prov or "PZ", "-".join(rng.sample(BASES, rng.choice([1, 1, 1, 2]))))
+                   for name, prov in comuni],
+    }
+
+def _bulletin_lines(bulletin):
+    today = bulletin["today_date"]
+    tomorrow = today + timedelta(days=1)
+    header = ("ZONE DI ALLERTA CRITICITA' IDROGEOLOGICA CRITICITA' IDROGEOLOGICA PER TEMPORALI "
+              "CRITICITA' IDRAULICA NOTE")
+    pages = [[
+        "REGIONE BASILICATA - CENTRO FUNZIONALE DECENTRATO",
+        "BOLLETTINO DI CRITICITA' IDROGEOLOGICA E IDRAULICA",
+        f"PER LA GIORNATA DI OGGI, {WEEKDAYS[today.weekday()]} {today:%d/%m/%Y}:",
+        header,
+        *(f"BASI {base} {' '.join(levels)}" for base, levels in bulletin["today"].items()),
+        f"PER LA GIORNATA DI DOMANI, {WEEKDAYS[tomorrow.weekday()]} {tomorrow:%d/%m/%Y}:",
+        header,
+        *(f"BASI {base} {' '.join(levels)}" for base, levels in bulletin["tomorrow"].items()),
+    ]]
+    rows = [f"{name} {prov} {zones}" for name, prov, zones in bulletin["comuni"]]
+    rows_per_page = 50
+    for start in range(0, len(rows), rows_per_page):
+        pages.append(["COMUNE PROV. ZONA DI ALLERTA", *rows[start:start + rows_per_page]])
+    # Pagine finali di avvertenze, che l'estrattore non dovrebbe leggere
+    pages.extend([f"AVVERTENZE - pagina {i + 1}"] + ["Testo descrittivo delle avvertenze."] * 40
+                 for i in range(3))
+    return pages
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def write_bulletin_pdf(bulletin, path):
+    """
+    Scrive il bollettino come PDF di solo testo (font standard Helvetica),
+    con la stessa struttura di righe del bollettino reale.
+    """
+    pages = _bulletin_lines(bulletin)
+    n_pages = len(pages)
+    # Oggetti: 1 catalogo, 2 albero pagine, 3 font, poi (pagina, contenuto) per ogni pagina
+    objects = {
+        1: b"<< /Type /Catalog /Pages 2 0 R >>",
+        3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    }
+    kids = []
+    for index, lines in enumerate(pages):
+        page_id, content_id = 4 + 2 * index, 5 + 2 * index
+        kids.append(f"{page_id} 0 R")
+        text = "\n".join(f"({_escape(line)}) Tj T*" for line in lines)
+        stream = f"BT /F1 9 Tf 11 TL 36 806 Td\n{text}\nET".encode('latin-1', 'replace')
+        objects[page_id] = (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>").encode()
+        objects[content_id] = b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream)
+    objects[2] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {n_pages} >>".encode()
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for object_id in sorted(objects):
+        offsets[object_id] = len(output)
+        output += b"%d 0 obj\n%s\nendobj\n" % (object_id, objects[object_id])
+    xref_offset = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for object_id in sorted(objects):
+        output += b"%010d 00000 n \n" % offsets[object_id]
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+    with open(path, 'wb') as f:
+        f.write(output)
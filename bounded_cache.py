@@ -0,0 +1,102 @@
+"""
+Cache LRU in memoria limitata in byte (stimati), condivisa tra più tipi di dato.
+
+Ogni voce ha una dimensione stimata da chi la inserisce; quando il totale supera
+il limite vengono rimosse le voci usate meno di recente. La creazione di una voce
+mancante avviene fuori dal lock globale, con un lock per chiave: due richieste
+per la stessa chiave calcolano il valore una sola volta, mentre chiavi diverse
+(es. regioni diverse) non si bloccano a vicenda.
+"""
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+class BoundedCache:
+    def __init__(self, max_bytes, on_evict=None):
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict  # chiamata con (chiave, dimensione) per ogni voce rimossa per spazio
+        self._entries = OrderedDict()  # chiave -> (valore, dimensione)
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._key_locks = {}  # chiave -> [lock, numero di thread in attesa o al lavoro]
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value, nbytes):
+        """
+        Inserisce (o sostituisce) una voce e rimuove le meno recenti finché il
+        totale non rientra nel limite. La voce appena inserita non viene mai
+        rimossa, anche se da sola supera il limite.
+        """
+        evicted = []
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._total_bytes -= old[1]
+            self._entries[key] = (value, nbytes)
+            self._total_bytes += nbytes
+            while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                old_key, (_, old_bytes) = self._entries.popitem(last=False)
+                self._total_bytes -= old_bytes
+                evicted.append((old_key, old_bytes))
+        if self.on_evict is not None:
+            for old_key, old_bytes in evicted:
+                self.on_evict(old_key, old_bytes)
+
+    def discard(self, predicate):
+        """
+        Rimuove le voci la cui chiave soddisfa `predicate`.
+        """
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                self._total_bytes -= self._entries.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    @contextmanager
+    def key_lock(self, key):
+        """
+        Lock esclusivo per una singola chiave, da tenere mentre se ne calcola il valore.
+        """
+        with self._lock:
+            slot = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            slot[1] += 1
+        try:
+            with slot[0]:
+                yield
+        finally:
+            with self._lock:
+                slot[1] -= 1
+                if slot[1] == 0:
+                    del self._key_locks[key]
+
+    def get_or_create(self, key, factory, sizeof):
+        """
+        Restituisce il valore in cache per `key`, creandolo con `factory()` (una
+        sola volta anche con richieste concorrenti) e stimandone la dimensione con
+        `sizeof(valore)` se manca.
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        with self.key_lock(key):
+            value = self.get(key, _MISSING)
+            if value is _MISSING:
+                value = factory()
+                self.put(key, value, sizeof(value))
+            return value
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._total_bytes, "max_bytes": self.max_bytes}
+
+_MISSING = object()
@@ -0,0 +1,110 @@
+"""
+Elaborazione dei bollettini da riga di comando, senza avviare il server web.
+
+  process  elabora una volta il bollettino di una o più regioni e pubblica le
+           mappe, come /process_bulletin (utile da cron o in batch);
+  watch    worker di lunga durata: controlla periodicamente i PDF delle regioni
+           ed elabora ogni bollettino nuovo o modificato.
+
+Le librerie pesanti vengono caricate solo quando servono; con --prewarm vengono
+caricate all'avvio insieme alla geometria e ai worker di rendering, così le
+elaborazioni successive non ne pagano il costo.
+
+Uso (dalla radice del repository):
+    python cli.py process [--region basilicata ...] [--pdf bollettino.pdf] [--in-process] [--json]
+    python cli.py watch [--region basilicata ...] [--interval 60] [--prewarm]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import app
+
+def _selected_regions(parser, region_ids):
+    regions = app.load_regions()
+    for region_id in region_ids:
+        if region_id not in regions:
+            parser.error(f"Regione non configurata: {region_id} (disponibili: {', '.join(regions)})")
+    return region_ids or [app.default_region_id()]
+
+def process_region(region_id, pdf_path=None, render_in_process=False):
+    """
+    Elabora il bollettino della regione (o `pdf_path`, se indicato) e
+    restituisce il risultato della pipeline.
+    """
+    region = app.get_region(region_id)
+    result = app.run_bulletin_pipeline(pdf_path or region["pdf"], region["geojson"], app.region_maps_dir(region_id),
+                                       render_in_process=render_in_process, zone_mapping_path=region["zone_mapping"])
+    result["region"] = region_id
+    return result
+
+def _print_result(result, as_json):
+    if as_json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return
+    print(f"[{result['region']}] {result['message']}")
+    for map_info in result.get("maps", []):
+        print(f"  {map_info['title']}: {map_info['filename']}")
+    for day, delta in ((result.get("changes") or {}).get("days") or {}).items():
+        print(f"  {day}: {len(delta['comuni'])} comuni con livello cambiato")
+
+def command_process(parser, args):
+    region_ids = _selected_regions(parser, args.region)
+    if args.pdf and len(region_ids) != 1:
+        parser.error("--pdf richiede una sola regione")
+    if args.prewarm:
+        app.prewarm(region_ids, render_pool=not args.in_process)
+    failed = False
+    for region_id in region_ids:
+        result = process_region(region_id, args.pdf, render_in_process=args.in_process)
+        _print_result(result, args.json)
+        failed = failed or result["status"] != "success"
+    return 1 if failed else 0
+
+def command_watch(parser, args):
+    region_ids = _selected_regions(parser, args.region)
+    if args.prewarm:
+        app.prewarm(region_ids, render_pool=not args.in_process)
+    processed = {}  # regione -> SHA-256 dell'ultimo PDF elaborato
+    print(f"In attesa di bollettini per: {', '.join(region_ids)} (controllo ogni {args.interval} s)")
+    try:
+        while True:
+            for region_id in region_ids:
+                pdf_path = app.get_region(region_id)["pdf"]
+                if not os.path.exists(pdf_path):
+                    continue
+                pdf_sha = app._file_sha256(pdf_path)
+                if processed.get(region_id) == pdf_sha:
+                    continue
+                result = process_region(region_id, render_in_process=args.in_process)
+                _print_result(result, args.json)
+                # Un bollettino non elaborabile non viene ritentato finché il file non cambia
+                processed[region_id] = pdf_sha
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for name, help_text in (("process", "Elabora una volta i bollettini"),
+                            ("watch", "Elabora i bollettini nuovi o modificati (worker)")):
+        subparser = subparsers.add_parser(name, help=help_text)
+        subparser.add_argument('--region', action='append', default=[],
+                               help="Regione da elaborare, ripetibile (default: la regione predefinita)")
+        subparser.add_argument('--in-process', action='store_true',
+                               help="Genera le mappe in questo processo invece che nel pool di worker")
+        subparser.add_argument('--prewarm', action='store_true',
+                               help="Carica librerie, geometria e worker di rendering all'avvio")
+        subparser.add_argument('--json', action='store_true', help="Stampa il risultato completo in JSON")
+    subparsers.choices["process"].add_argument('--pdf', help="PDF da elaborare al posto di quello configurato")
+    subparsers.choices["watch"].add_argument('--interval', type=float, default=60,
+                                             help="Secondi tra due controlli dei PDF (default: 60)")
+    args = parser.parse_args(argv)
+    command = command_process if args.command == 'process' else command_watch
+    return command(parser, args)
+
+if __name__ == '__main__':
+    sys.exit(main())
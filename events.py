@@ -0,0 +1,190 @@
+"""
+Notifiche in tempo reale ai browser con Server-Sent Events (SSE).
+
+Le connessioni SSE restano aperte a lungo e quasi sempre inattive: invece di
+occupare un thread del server Flask per ciascuna, vengono servite da un piccolo
+server HTTP asyncio in un unico thread di background, su una porta dedicata
+(o dietro lo stesso reverse proxy, es. location /events). Centinaia di client
+costano solo un socket e una coda ciascuno.
+
+Chiunque, da qualsiasi thread, può pubblicare un evento per una regione con
+publish(); il server lo inoltra a tutti i client collegati a quella regione.
+Gli ultimi eventi di ogni regione vengono conservati, così un client che si
+riconnette (l'EventSource lo fa da sé, inviando Last-Event-ID) riceve quelli persi.
+"""
+import asyncio
+import itertools
+import json
+import threading
+from collections import deque
+from urllib.parse import parse_qs, urlsplit
+
+HISTORY_SIZE = 50         # Eventi conservati per regione per le riconnessioni
+CLIENT_QUEUE_SIZE = 100   # Eventi in attesa per client; oltre, il client lento viene disconnesso
+MAX_CLIENTS = 2000
+HEARTBEAT_SECONDS = 15    # Commento periodico: tiene aperti proxy e NAT e rileva i client scollegati
+RETRY_MILLISECONDS = 3000 # Attesa suggerita al browser prima di riconnettersi
+REQUEST_TIMEOUT_SECONDS = 10
+
+_ids = itertools.count(1)
+_lock = threading.Lock()
+_history = {}      # regione -> deque di (id, evento, dati serializzati)
+_subscribers = {}  # regione -> set di code asyncio dei client collegati
+_loop = None       # Loop del server, se avviato
+
+def publish(region, event, data):
+    """
+    Pubblica l'evento `event` con i dati `data` (serializzabili in JSON) per i
+    client della regione. Non blocca: se il server non è avviato l'evento viene
+    solo conservato nella cronologia.
+    """
+    with _lock:
+        record = (next(_ids), event, json.dumps(data, ensure_ascii=False))
+        _history.setdefault(region, deque(maxlen=HISTORY_SIZE)).append(record)
+        loop = _loop
+    if loop is not None:
+        loop.call_soon_threadsafe(_dispatch, region, record)
+
+def _dispatch(region, record):
+    subscribers = _subscribers.get(region, set())
+    for queue in list(subscribers):
+        if queue.qsize() >= CLIENT_QUEUE_SIZE:
+            # Client troppo lento: viene chiuso e si riconnetterà recuperando gli eventi persi
+            subscribers.discard(queue)
+            queue.put_nowait(None)
+        else:
+            queue.put_nowait(record)
+
+def _missed_events(region, last_event_id):
+    with _lock:
+        return [record for record in _history.get(region, ()) if record[0] > last_event_id]
+
+def _format_event(record):
+    event_id, event, data = record
+    return f"id: {event_id}\nevent: {event}\ndata: {data}\n\n".encode()
+
+def last_event_id(region):
+    """
+    Id dell'ultimo evento pubblicato per la regione (0 se nessuno): una pagina
+    generata ora può chiedere al collegamento gli eventi successivi (?lastEventId=).
+    """
+    with _lock:
+        history = _history.get(region)
+        return history[-1][0] if history else 0
+
+def is_running():
+    return _loop is not None
+
+def client_count():
+    return sum(len(queues) for queues in _subscribers.values())
+
+async def _read_request(reader):
+    request_line = (await reader.readline()).decode('latin-1').split()
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode('latin-1').strip()
+        if not line:
+            break
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return request_line, headers
+
+def _response_head(status, content_type, extra=""):
+    return (f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+            f"Access-Control-Allow-Origin: *\r\n{extra}\r\n").encode()
+
+async def _handle_client(reader, writer, resolve_region):
+    try:
+        try:
+            request_line, headers = await asyncio.wait_for(_read_request(reader), REQUEST_TIMEOUT_SECONDS)
+        except (asyncio.TimeoutError, ConnectionError, UnicodeDecodeError):
+            return
+        if len(request_line) < 2 or request_line[0] != 'GET' or urlsplit(request_line[1]).path.rstrip('/') != '/events':
+            writer.write(_response_head("404 Not Found", "text/plain", "Connection: close\r\n"))
+            return
+        query = parse_qs(urlsplit(request_line[1]).query)
+        region = resolve_region((query.get('region') or [None])[0])
+        if region is None:
+            writer.write(_response_head("404 Not Found", "text/plain", "Connection: close\r\n"))
+            return
+        if client_count() >= MAX_CLIENTS:
+            writer.write(_response_head("503 Service Unavailable", "text/plain", "Connection: close\r\n"))
+            return
+        try:
+            last_event_id = int(headers.get('last-event-id') or (query.get('lastEventId') or [0])[0])
+        except ValueError:
+            last_event_id = 0
+
+        queue = asyncio.Queue()
+        _subscribers.setdefault(region, set()).add(queue)
+        try:
+            writer.write(_response_head("200 OK", "text/event-stream",
+                                        "Cache-Control: no-cache\r\nX-Accel-Buffering: no\r\n"))
+            writer.write(f"retry: {RETRY_MILLISECONDS}\n\n".encode())
+            if last_event_id:
+                for record in _missed_events(region, last_event_id):
+                    writer.write(_format_event(record))
+            await writer.drain()
+            # Il client non invia altro: la fine della lettura segnala che si è scollegato
+            disconnected = asyncio.ensure_future(reader.read())
+            try:
+                while True:
+                    next_record = asyncio.ensure_future(queue.get())
+                    done, _ = await asyncio.wait({next_record, disconnected}, timeout=HEARTBEAT_SECONDS,
+                                                 return_when=asyncio.FIRST_COMPLETED)
+                    if disconnected in done:
+                        next_record.cancel()
+                        return
+                    if next_record not in done:
+                        next_record.cancel()
+                        writer.write(b": ping\n\n")
+                    elif next_record.result() is None:
+                        return
+                    else:
+                        writer.write(_format_event(next_record.result()))
+                    # Un client che non legge non deve trattenere il flusso all'infinito
+                    await asyncio.wait_for(writer.drain(), HEARTBEAT_SECONDS)
+            finally:
+                disconnected.cancel()
+        finally:
+            subscribers = _subscribers.get(region, set())
+            subscribers.discard(queue)
+            if not subscribers:
+                _subscribers.pop(region, None)
+    except (ConnectionError, asyncio.TimeoutError):
+        pass
+    finally:
+        writer.close()
+
+def start_server(host, port, resolve_region):
+    """
+    Avvia il server SSE in un thread daemon. I client si collegano a
+    http://<host>:<port>/events?region=<id>; `resolve_region(id)` restituisce
+    la regione da seguire (es. quella predefinita se `id` è None) o None se non esiste.
+    """
+    started = threading.Event()
+
+    def run():
+        global _loop
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+
+        async def handle(reader, writer):
+            await _handle_client(reader, writer, resolve_region)
+
+        try:
+            server = loop.run_until_complete(asyncio.start_server(handle, host, port, reuse_address=True))
+        except OSError as e:
+            print(f"Impossibile avviare il server degli eventi su {host}:{port}: {e}")
+            started.set()
+            return
+        with _lock:
+            _loop = loop
+        started.set()
+        print(f"Server degli eventi in ascolto su http://{host}:{port}/events")
+        loop.run_until_complete(server.serve_forever())
+
+    thread = threading.Thread(target=run, name='bulletin-events', daemon=True)
+    thread.start()
+    started.wait(5)
+    return thread
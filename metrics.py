@@ -0,0 +1,195 @@
+"""
+Metriche di processo in formato testuale Prometheus: contatori e istogrammi con
+etichette, misura dei tempi delle fasi e profilazione cProfile su richiesta.
+
+La modalità si sceglie con la variabile d'ambiente BOLLETTINO_METRICS:
+  "basic"    (predefinita, per la produzione) aggiorna solo contatori e istogrammi
+             in memoria: un perf_counter e un lock per osservazione;
+  "detailed" in più stampa una riga JSON per ogni intervallo misurato;
+  "off"      non registra nulla.
+
+Le osservazioni fatte in un processo worker possono essere raccolte con capture()
+e riapplicate nel processo principale con replay().
+"""
+import bisect
+import cProfile
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+MODES = ("off", "basic", "detailed")
+MODE = os.environ.get('BOLLETTINO_METRICS', 'basic').lower()
+if MODE not in MODES:
+    MODE = "basic"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_registry = {}  # nome -> metrica, nell'ordine di definizione
+_local = threading.local()
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+def _format_labels(label_names, label_values, extra=()):
+    pairs = list(zip(label_names, label_values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        if name in _registry:
+            raise ValueError(f"Metrica già definita: {name}")
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry[name] = self
+
+    def _label_values(self, labels):
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def _submit(self, label_values, value):
+        records = getattr(_local, 'records', None)
+        if records is not None:
+            records.append((self.name, label_values, value))
+        else:
+            self._record(label_values, value)
+
+    def _record(self, label_values, value):
+        raise NotImplementedError
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    """
+    Contatore monotono; il nome dovrebbe terminare in "_total".
+    """
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        if MODE != "off":
+            self._submit(self._label_values(labels), amount)
+
+    def _record(self, label_values, value):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + value
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, label_values)} {_format_value(value)}")
+        return lines
+
+class Histogram(_Metric):
+    """
+    Istogramma a bucket cumulativi, con somma e numero delle osservazioni.
+    """
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        if MODE != "off":
+            self._submit(self._label_values(labels), value)
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Misura in secondi la durata del blocco (anche se solleva un'eccezione).
+        """
+        if MODE == "off":
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.observe(seconds, **labels)
+            if MODE == "detailed":
+                print(json.dumps({"metric": self.name, **labels, "seconds": round(seconds, 6), "pid": os.getpid()}))
+
+    def _record(self, label_values, value):
+        with self._lock:
+            state = self._values.get(label_values)
+            if state is None:
+                state = self._values[label_values] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            position = bisect.bisect_left(self.buckets, value)
+            if position < len(self.buckets):
+                state["buckets"][position] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            for label_values, state in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, state["buckets"]):
+                    cumulative += count
+                    labels = _format_labels(self.label_names, label_values, [("le", _format_value(bound))])
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.label_names, label_values, [("le", "+Inf")])
+                lines.append(f"{self.name}_bucket{labels} {state['count']}")
+                labels = _format_labels(self.label_names, label_values)
+                lines.append(f"{self.name}_sum{labels} {_format_value(state['sum'])}")
+                lines.append(f"{self.name}_count{labels} {state['count']}")
+        return lines
+
+@contextmanager
+def capture():
+    """
+    Raccoglie (invece di registrarle) le osservazioni fatte nel thread corrente
+    durante il blocco: la lista prodotta va passata a replay(), anche in un altro processo.
+    """
+    records = []
+    previous = getattr(_local, 'records', None)
+    _local.records = records
+    try:
+        yield records
+    finally:
+        _local.records = previous
+
+def replay(records):
+    """
+    Registra le osservazioni raccolte con capture().
+    """
+    for name, label_values, value in records:
+        _registry[name]._submit(label_values, value)
+
+def render_prometheus():
+    """
+    Tutte le metriche nel formato di esposizione testuale di Prometheus (0.0.4).
+    """
+    lines = []
+    for metric in _registry.values():
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+@contextmanager
+def profile_to(path):
+    """
+    Profila con cProfile il thread corrente durante il blocco e salva le
+    statistiche in `path` (leggibili con pstats o snakeviz).
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        profiler.dump_stats(path)
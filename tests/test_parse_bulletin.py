@@ -0,0 +1,79 @@
+"""
+Test di parse_bulletin_lines su righe di testo costruite a mano, senza PDF.
+"""
+from app import parse_bulletin_lines
+
+HEADER = ("ZONE DI ALLERTA CRITICITA' IDROGEOLOGICA CRITICITA' IDROGEOLOGICA PER TEMPORALI "
+          "CRITICITA' IDRAULICA NOTE")
+
+def _day_table(day, date, rows):
+    return [f"PER LA GIORNATA DI {day}, VENERDI' {date}:", HEADER, *rows]
+
+def _comuni_table(rows):
+    return ["COMUNE PROV. ZONA DI ALLERTA", *rows]
+
+def test_dates_are_read_from_the_bulletin():
+    lines = (
+        _day_table("OGGI", "03/11/2026", ["BASI A1 ASSENTE-VERDE ORDINARIA - GIALLO ASSENTE-VERDE"])
+        + _day_table("DOMANI", "04/11/2026", ["BASI A1 MODERATA-ARANCIONE ASSENTE-VERDE ASSENTE-VERDE"])
+        + _comuni_table(["Abriola PZ A1"])
+    )
+    bulletin = parse_bulletin_lines(lines)
+    assert bulletin["today_date"] == "03/11/2026"
+    assert bulletin["tomorrow_date"] == "04/11/2026"
+    # Massima gravosità tra i tre tipi di criticità della base
+    assert bulletin["today"] == {"A1": "GIALLO"}
+    assert bulletin["tomorrow"] == {"A1": "ARANCIONE"}
+
+def test_level_cells_wrapped_onto_the_next_line():
+    lines = (
+        _day_table("OGGI", "28/05/2025", [
+            "BASI A1 ASSENTE-VERDE",
+            "ASSENTE-VERDE ELEVATA-ROSSO",
+            "BASI B ORDINARIA -",
+            "GIALLO ASSENTE-VERDE ASSENTE-VERDE",
+        ])
+        + _comuni_table(["Abriola PZ A1"])
+    )
+    bulletin = parse_bulletin_lines(lines)
+    assert bulletin["today"] == {"A1": "ROSSO", "B": "GIALLO"}
+
+def test_comuni_with_multiple_zones():
+    lines = (
+        _day_table("OGGI", "28/05/2025", ["BASI A1 ASSENTE-VERDE ASSENTE-VERDE ASSENTE-VERDE"])
+        + _comuni_table(["Ferrandina MT B-E2", "Accettura MT A1 - B", "San Chirico Nuovo PZ A1-B-C"])
+    )
+    mapping = parse_bulletin_lines(lines)["comune_to_bases_mapping"]
+    assert mapping == {
+        "Ferrandina": ["B", "E2"],
+        "Accettura": ["A1", "B"],
+        "San Chirico Nuovo": ["A1", "B", "C"],
+    }
+
+def test_bulletin_without_tomorrow_table_is_read_to_the_end():
+    # Senza la tabella di domani le sezioni non sono mai "complete": la lettura
+    # non deve fermarsi dopo il primo blocco di righe non tabellari
+    lines = (
+        _day_table("OGGI", "28/05/2025", ["BASI A1 ASSENTE-VERDE ASSENTE-VERDE ORDINARIA - GIALLO"])
+        + _comuni_table(["Abriola PZ A1"])
+        + ["AVVERTENZE"] + ["Testo descrittivo delle avvertenze."] * 10
+        + _comuni_table(["Ferrandina MT A1"])
+    )
+    consumed = []
+    bulletin = parse_bulletin_lines(line for line in lines if not consumed.append(line))
+    assert len(consumed) == len(lines)
+    assert bulletin["today"] == {"A1": "GIALLO"}
+    assert bulletin["tomorrow"] == {}
+    assert bulletin["tomorrow_date"] is None
+    assert set(bulletin["comune_to_bases_mapping"]) == {"Abriola", "Ferrandina"}
+
+def test_reading_stops_after_complete_tables():
+    lines = (
+        _day_table("OGGI", "28/05/2025", ["BASI A1 ASSENTE-VERDE ASSENTE-VERDE ASSENTE-VERDE"])
+        + _day_table("DOMANI", "29/05/2025", ["BASI A1 ASSENTE-VERDE ASSENTE-VERDE ASSENTE-VERDE"])
+        + _comuni_table(["Abriola PZ A1"])
+        + ["AVVERTENZE"] + ["Testo descrittivo delle avvertenze."] * 10
+    )
+    consumed = []
+    parse_bulletin_lines(line for line in lines if not consumed.append(line))
+    assert len(consumed) < len(lines)
@@ -0,0 +1,113 @@
+"""
+Test della semplificazione topologica dei livelli di dettaglio su una griglia
+di comuni sintetici con confini frastagliati.
+"""
+import math
+import time
+
+import geopandas as gpd
+import pytest
+import shapely
+from shapely.geometry import Polygon
+
+import app
+import topology
+
+CELL = 0.1
+ROWS = COLUMNS = 3
+STEPS = 40
+AMPLITUDE = 0.0004  # Sotto la tolleranza dei livelli più grossolani: i confini vengono semplificati
+
+def _edge(start, end, jagged):
+    """
+    Confine tra due vertici della griglia; quelli interni sono frastagliati.
+    """
+    (x0, y0), (x1, y1) = start, end
+    points = []
+    for step in range(STEPS + 1):
+        t = step / STEPS
+        offset = AMPLITUDE * math.sin(step * 1.7) if jagged and 0 < step < STEPS else 0
+        # Lo scostamento è perpendicolare al lato (i lati sono orizzontali o verticali)
+        points.append((x0 + (x1 - x0) * t + (offset if x0 == x1 else 0),
+                       y0 + (y1 - y0) * t + (offset if y0 == y1 else 0)))
+    return points
+
+def _interior(a, b):
+    if a[0] == b[0]:
+        return 0 < a[0] < COLUMNS
+    return 0 < a[1] < ROWS
+
+def _grid():
+    def vertex(i, j):
+        return (15 + i * CELL, 40 + j * CELL)
+
+    def edge(a, b):
+        # Ogni confine viene generato una sola volta e percorso al contrario dal vicino
+        key = (min(a, b), max(a, b))
+        points = _edge(vertex(*key[0]), vertex(*key[1]), jagged=_interior(*key))
+        return points if key[0] == a else points[::-1]
+
+    cells = []
+    for i in range(COLUMNS):
+        for j in range(ROWS):
+            corners = [(i, j), (i + 1, j), (i + 1, j + 1), (i, j + 1), (i, j)]
+            ring = []
+            for a, b in zip(corners, corners[1:]):
+                ring.extend(edge(a, b)[:-1])
+            cells.append(Polygon(ring))
+    return cells
+
+def test_levels_have_no_overlaps_or_gaps():
+    cells = _grid()
+    assert all(cell.is_valid for cell in cells)
+    original_union = shapely.union_all(cells)
+
+    levels = app._build_simplified_levels(gpd.GeoDataFrame(geometry=cells))
+    assert [max_zoom for max_zoom, _ in levels] == [max_zoom for max_zoom, _ in app.GEOMETRY_LEVELS]
+    vertex_counts = [sum(len(arc) for arc in simplified["arcs"]) for _, simplified in levels]
+    assert vertex_counts == sorted(vertex_counts) and vertex_counts[0] < vertex_counts[-1]
+
+    for max_zoom, simplified in levels:
+        geometries = topology.topology_to_geometries(simplified)
+        assert all(geometry is not None and geometry.is_valid for geometry in geometries)
+        union = shapely.union_all(geometries)
+        # Nessuna sovrapposizione: l'area dell'unione è la somma delle aree
+        assert sum(geometry.area for geometry in geometries) == pytest.approx(union.area)
+        # Nessun buco tra comuni: l'unione resta un unico poligono senza fori, come l'originale
+        assert union.geom_type == 'Polygon' and not list(union.interiors)
+        assert union.symmetric_difference(original_union).area < 1e-6
+
+def test_invalid_source_geometry_does_not_stall_simplification():
+    cells = _grid()
+    # Anello a farfalla che si autointerseca: non è valido a nessuna tolleranza
+    bowtie = Polygon([(15.5, 40.0), (15.6, 40.1), (15.6, 40.0), (15.5, 40.1)])
+    assert not bowtie.is_valid
+
+    start = time.perf_counter()
+    levels = app._build_simplified_levels(gpd.GeoDataFrame(geometry=cells + [bowtie]))
+    assert time.perf_counter() - start < 5
+
+    full_resolution = levels[-1][1]
+    assert levels[0][1]["arcs"] != full_resolution["arcs"]  # Il resto della geometria viene comunque semplificato
+    for _, simplified in levels:
+        geometries = topology.topology_to_geometries(simplified)
+        assert all(geometry.is_valid for geometry in geometries[:len(cells)])
+
+def test_simplify_valid_falls_back_to_full_resolution():
+    # Un comune sottile tra due confini curvi con gli stessi estremi: semplificati
+    # entrambi al segmento che li unisce, il comune si riduce a zero area
+    inner = [(0.01 * math.sin(math.pi * k / 20), k / 20) for k in range(21)]
+    outer = [(0.02 * math.sin(math.pi * k / 20), k / 20) for k in range(21)]
+    left = Polygon([(-1, 1), (-1, 0), *inner])
+    sliver = Polygon([*inner, *outer[::-1]])
+    right = Polygon([*outer, (1, 1), (1, 0)])
+    base = topology.build_topology([left, sliver, right])
+    assert all(geometry.is_valid for geometry in topology.topology_to_geometries(base))
+
+    simplified = topology.simplify_valid(base, 1, max_halvings=2)
+    assert simplified["arcs"] == base["arcs"]
+    # Con abbastanza dimezzamenti si trova invece una tolleranza che lo preserva
+    simplified = topology.simplify_valid(base, 1)
+    assert simplified["arcs"] != base["arcs"]
+    assert all(geometry is not None and geometry.is_valid
+               for geometry in topology.topology_to_geometries(simplified))
@@ -0,0 +1,212 @@
+"""
+Topologia dei poligoni dei comuni: archi condivisi, semplificazione e TopoJSON.
+
+I confini comuni a due comuni vengono memorizzati una sola volta (come "archi")
+su una griglia di coordinate intere (quantizzazione). Semplificando gli archi
+invece dei singoli poligoni, i comuni confinanti restano perfettamente combacianti
+a ogni livello di dettaglio: non compaiono né buchi né sovrapposizioni.
+"""
+import shapely
+from shapely.geometry import LineString, MultiPolygon, Polygon
+
+DEFAULT_QUANTIZATION = 100_000
+
+def _polygons(geometry):
+    if geometry is None or geometry.is_empty:
+        return []
+    if geometry.geom_type == 'MultiPolygon':
+        return list(geometry.geoms)
+    return [geometry]
+
+def _quantize_ring(coords, x0, y0, kx, ky):
+    ring = []
+    for x, y in coords:
+        point = (round((x - x0) / kx), round((y - y0) / ky))
+        if not ring or ring[-1] != point:
+            ring.append(point)
+    if len(ring) > 1 and ring[0] == ring[-1]:
+        ring.pop()  # Gli anelli vengono gestiti aperti; la chiusura è implicita
+    return ring
+
+def _find_junctions(rings):
+    """
+    Un punto è una giunzione se compare in più anelli con vicini diversi:
+    è lì che un confine condiviso inizia o finisce.
+    """
+    neighbours = {}
+    junctions = set()
+    for ring in rings:
+        n = len(ring)
+        for i, point in enumerate(ring):
+            pair = frozenset((ring[i - 1], ring[(i + 1) % n]))
+            seen = neighbours.setdefault(point, pair)
+            if seen != pair:
+                junctions.add(point)
+    return junctions
+
+def _cut_ring(ring, junctions):
+    """
+    Divide un anello aperto in archi che iniziano e finiscono su una giunzione.
+    Un anello senza giunzioni diventa un unico arco chiuso, ruotato in forma
+    canonica così che anelli identici (es. enclave e foro) producano lo stesso arco.
+    """
+    starts = [i for i, point in enumerate(ring) if point in junctions]
+    if not starts:
+        start = min(range(len(ring)), key=ring.__getitem__)
+        rotated = ring[start:] + ring[:start]
+        return [rotated + [rotated[0]]]
+
+    rotated = ring[starts[0]:] + ring[:starts[0]]
+    offsets = [i - starts[0] for i in starts] + [len(ring)]
+    rotated.append(rotated[0])
+    return [rotated[a:b + 1] for a, b in zip(offsets, offsets[1:])]
+
+def build_topology(geometries, quantization=DEFAULT_QUANTIZATION):
+    """
+    Costruisce la topologia di una sequenza di (Multi)Polygon.
+
+    Restituisce un dizionario con la trasformazione della griglia ("scale",
+    "translate"), gli archi in coordinate intere e, per ogni geometria, la lista
+    dei poligoni come anelli di riferimenti agli archi (~i = arco i percorso al
+    contrario, come in TopoJSON).
+    """
+    geometries = list(geometries)
+    x0, y0, x1, y1 = shapely.total_bounds(geometries)
+    kx = (x1 - x0) / (quantization - 1) or 1
+    ky = (y1 - y0) / (quantization - 1) or 1
+
+    quantized = [
+        [[_quantize_ring(ring.coords, x0, y0, kx, ky) for ring in (polygon.exterior, *polygon.interiors)]
+         for polygon in _polygons(geometry)]
+        for geometry in geometries
+    ]
+    junctions = _find_junctions(ring for polygons in quantized for rings in polygons for ring in rings)
+
+    arcs = []
+    arc_index = {}  # sequenza di punti -> indice dell'arco
+    objects = []
+    for polygons in quantized:
+        object_polygons = []
+        for rings in polygons:
+            object_rings = []
+            for ring in rings:
+                if len(ring) < 3:
+                    continue
+                refs = []
+                for arc in _cut_ring(ring, junctions):
+                    key = tuple(arc)
+                    if key in arc_index:
+                        refs.append(arc_index[key])
+                    elif key[::-1] in arc_index:
+                        refs.append(~arc_index[key[::-1]])
+                    else:
+                        arc_index[key] = len(arcs)
+                        refs.append(len(arcs))
+                        arcs.append(arc)
+                object_rings.append(refs)
+            if object_rings:
+                object_polygons.append(object_rings)
+        objects.append(object_polygons)
+
+    return {"scale": (kx, ky), "translate": (x0, y0), "arcs": arcs, "objects": objects}
+
+def simplify_arcs(topology, tolerance):
+    """
+    Semplifica gli archi (Douglas-Peucker, estremi fissi) con una tolleranza
+    espressa nelle unità delle coordinate originali. Gli archi condivisi vengono
+    semplificati una volta sola, quindi i confini tra comuni restano coincidenti.
+    """
+    if tolerance <= 0:
+        return dict(topology)
+    grid_tolerance = tolerance / max(topology["scale"])
+    simplified = []
+    for arc in topology["arcs"]:
+        if len(arc) <= 2:
+            simplified.append(arc)
+            continue
+        coords = [tuple(map(int, point)) for point in
+                  shapely.simplify(LineString(arc), grid_tolerance).coords]
+        # Un arco chiuso deve restare un anello valido
+        if arc[0] == arc[-1] and len(coords) < 4:
+            coords = arc
+        simplified.append(coords)
+    return dict(topology, arcs=simplified)
+
+def simplify_valid(topology, tolerance, max_halvings=10):
+    """
+    Come simplify_arcs, ma dimezza la tolleranza finché le geometrie restano
+    valide. Si richiede la validità solo alle geometrie già valide nella
+    topologia a piena risoluzione: un poligono sorgente non valido (es. un
+    anello che si autointerseca) non lo diventerebbe a nessuna tolleranza.
+    Dopo `max_halvings` tentativi si usano gli archi a piena risoluzione.
+    """
+    if tolerance <= 0:
+        return simplify_arcs(topology, 0)
+    checked = [index for index, geometry in enumerate(topology_to_geometries(topology))
+               if geometry is not None and geometry.is_valid]
+    for _ in range(max_halvings + 1):
+        simplified = simplify_arcs(topology, tolerance)
+        geometries = topology_to_geometries(simplified)
+        if all(geometries[index] is not None and geometries[index].is_valid for index in checked):
+            return simplified
+        tolerance /= 2
+    return simplify_arcs(topology, 0)
+
+def _ring_coords(topology, refs):
+    kx, ky = topology["scale"]
+    x0, y0 = topology["translate"]
+    points = []
+    for ref in refs:
+        arc = topology["arcs"][ref] if ref >= 0 else topology["arcs"][~ref][::-1]
+        points.extend(arc[1:] if points else arc)
+    return [(x0 + x * kx, y0 + y * ky) for x, y in points]
+
+def topology_to_geometries(topology):
+    """
+    Ricostruisce i (Multi)Polygon shapely dalla topologia (eventualmente semplificata).
+    """
+    geometries = []
+    for polygons in topology["objects"]:
+        shapes = []
+        for rings in polygons:
+            coords = [_ring_coords(topology, refs) for refs in rings]
+            if len(coords[0]) >= 4:
+                shapes.append(Polygon(coords[0], [ring for ring in coords[1:] if len(ring) >= 4]))
+        if not shapes:
+            geometries.append(None)
+        elif len(shapes) == 1:
+            geometries.append(shapes[0])
+        else:
+            geometries.append(MultiPolygon(shapes))
+    return geometries
+
+def to_topojson(topology, properties, object_name='municipalities'):
+    """
+    Codifica la topologia come documento TopoJSON quantizzato (archi con
+    coordinate delta). `properties` è una lista di dizionari, uno per geometria;
+    l'"id" di ciascuna geometria è la sua posizione.
+    """
+    encoded_arcs = []
+    for arc in topology["arcs"]:
+        encoded = [list(arc[0])]
+        for (px, py), (x, y) in zip(arc, arc[1:]):
+            encoded.append([x - px, y - py])
+        encoded_arcs.append(encoded)
+
+    geometries = []
+    for index, (polygons, props) in enumerate(zip(topology["objects"], properties)):
+        geometry = {"id": index, "properties": props}
+        if not polygons:
+            geometry["type"] = None
+        elif len(polygons) == 1:
+            geometry.update(type="Polygon", arcs=polygons[0])
+        else:
+            geometry.update(type="MultiPolygon", arcs=polygons)
+        geometries.append(geometry)
+
+    return {
+        "type": "Topology",
+        "transform": {"scale": list(topology["scale"]), "translate": list(topology["translate"])},
+        "objects": {object_name: {"type": "GeometryCollection", "geometries": geometries}},
+        "arcs": encoded_arcs,
+    }